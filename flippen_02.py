@@ -8,21 +8,2338 @@ bl_info = {
     'category': 'Object'
 }
 
+import contextlib
+import os
+import sys
+import threading
+import time
+import types
 import bpy
+import numpy as np
 from bpy.props import EnumProperty
 
+# Mirrors the Logging preference (or the command line --verbose flag)
+console_log = False
+
 def log(text):
-    addon_prefs = bpy.context.preferences.addons[__name__].preferences
-    if getattr(addon_prefs, 'pref_log', False):
+    if console_log:
         print('flippen: ' + text)
     return {'FINISHED'}
 
+def update_log(self, context):
+    global console_log
+    console_log = self.pref_log
+
+class Stats:
+    # Named phase timers and counters for one run. Outside an enabled run phase() hands back a shared
+    # no-op context manager and count() returns at once, so instrumented code costs next to nothing.
+    # Counts also land on the innermost open phase, and phases may be timed from worker threads.
+    def __init__(self):
+        self.enabled = False
+        self.last = None
+        self._null = contextlib.nullcontext()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._phases = {}
+        self._counters = {}
+
+    @contextlib.contextmanager
+    def run(self, name, enabled=True, **info):
+        if not enabled or self.enabled:
+            yield
+            return
+        self._phases, self._counters = {}, {}
+        self.enabled = True
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.enabled = False
+            self.last = {
+                'run': name,
+                **info,
+                'seconds': time.perf_counter() - start,
+                'phases': self._phases,
+                'counters': self._counters,
+            }
+
+    def phase(self, name):
+        if not self.enabled:
+            return self._null
+        return self._timed(name)
+
+    @contextlib.contextmanager
+    def _timed(self, name):
+        stack = self._stack()
+        stack.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            with self._lock:
+                phase = self._phases.setdefault(name, {'seconds': 0.0, 'calls': 0})
+                phase['seconds'] += elapsed
+                phase['calls'] += 1
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        stack = self._stack()
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+            if stack:
+                phase = self._phases.setdefault(stack[-1], {'seconds': 0.0, 'calls': 0})
+                phase[name] = phase.get(name, 0) + n
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+stats = Stats()
+
+def profiled(name=None):
+    # Profile an operator's execute() as one run when the panel's Profile Runs option is on.
+    # The run is named after the operator unless a name is given.
+    def decorate(execute):
+        def wrapper(self, context):
+            obj = context.active_object
+            with stats.run(name or self.bl_label, context.window_manager.flippen_stats, object=obj.name if obj else None):
+                return execute(self, context)
+        return wrapper
+    return decorate
+
+def mode_set(mode):
+    with stats.phase('mode_set'):
+        bpy.ops.object.mode_set(mode=mode)
+
+def read_mesh_arrays(mesh):
+    # Pull the face and corner data out of an Object Mode mesh in bulk
+    n_faces = len(mesh.polygons)
+    n_corners = len(mesh.loops)
+    loop_start = np.empty(n_faces, dtype=np.int32)
+    loop_total = np.empty(n_faces, dtype=np.int32)
+    normals = np.empty(n_faces * 3, dtype=np.float32)
+    corner_vert = np.empty(n_corners, dtype=np.int32)
+    corner_edge = np.empty(n_corners, dtype=np.int32)
+    vert_co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.polygons.foreach_get('loop_start', loop_start)
+    mesh.polygons.foreach_get('loop_total', loop_total)
+    mesh.polygons.foreach_get('normal', normals)
+    mesh.loops.foreach_get('vertex_index', corner_vert)
+    mesh.loops.foreach_get('edge_index', corner_edge)
+    mesh.vertices.foreach_get('co', vert_co)
+    return {
+        'loop_start': loop_start,
+        'loop_total': loop_total,
+        'normals': normals.reshape(-1, 3),
+        'corner_vert': corner_vert,
+        'corner_edge': corner_edge,
+        'vert_co': vert_co.reshape(-1, 3),
+    }
+
+class FaceGraph:
+    # Face adjacency through shared edges, stored as CSR arrays.
+    # Every ordered pair of distinct faces on an edge is one entry, so a face sharing two
+    # edges with a neighbor sees it twice, exactly like walking f.loops -> edge.link_faces.
+    def __init__(self, loop_start, loop_total, normals, corner_vert, corner_edge, vert_co):
+        self.n_faces = len(loop_start)
+        self.loop_start = loop_start
+        self.loop_total = loop_total
+        self.normals = normals
+        self.corner_vert = corner_vert
+        self.corner_edge = corner_edge
+        self.vert_co = vert_co
+        self._centers = None
+        self._areas = None
+        self.corner_face = np.repeat(np.arange(self.n_faces, dtype=np.int32), loop_total)
+        src, dst = self._edge_corner_pairs(corner_edge)
+        pair_face = self.corner_face[src]
+        adj_faces = self.corner_face[dst]
+        keep = pair_face != adj_faces
+        src, dst = src[keep], dst[keep]
+        order = np.argsort(src, kind='stable')
+        src, dst = src[order], dst[order]
+        self.pair_face = self.corner_face[src]
+        self.adj_faces = self.corner_face[dst]
+        self.adj_edge = corner_edge[src]
+        # Both corners walk the shared edge from the same vertex: the windings disagree
+        self.adj_same_dir = corner_vert[src] == corner_vert[dst]
+        self.adj_offsets = np.zeros(self.n_faces + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.pair_face, minlength=self.n_faces), out=self.adj_offsets[1:])
+
+    @classmethod
+    def from_mesh(cls, mesh):
+        with stats.phase('read'):
+            arrays = read_mesh_arrays(mesh)
+        with stats.phase('adjacency'):
+            return cls(**arrays)
+
+    @property
+    def centers(self):
+        # Median face centers, as calc_center_median() would give
+        if self._centers is None:
+            if self.n_faces:
+                sums = np.add.reduceat(self.vert_co[self.corner_vert], self.loop_start, axis=0)
+                self._centers = sums / self.loop_total[:, None]
+            else:
+                self._centers = np.empty((0, 3), dtype=np.float32)
+        return self._centers
+
+    @property
+    def areas(self):
+        # Face areas from the Newell cross product sum of each face's corners
+        if self._areas is None:
+            if self.n_faces:
+                following = np.arange(1, len(self.corner_vert) + 1)
+                following[self.loop_start + self.loop_total - 1] = self.loop_start
+                co = self.vert_co[self.corner_vert]
+                cross = np.add.reduceat(np.cross(co, co[following]), self.loop_start, axis=0)
+                self._areas = 0.5 * np.linalg.norm(cross, axis=1)
+            else:
+                self._areas = np.empty(0, dtype=np.float32)
+        return self._areas
+
+    @staticmethod
+    def _edge_corner_pairs(corner_edge):
+        # All ordered (corner, other corner) pairs that share an edge
+        n = len(corner_edge)
+        if n == 0:
+            empty = np.empty(0, dtype=np.int32)
+            return empty, empty
+        order = np.argsort(corner_edge, kind='stable').astype(np.int32)
+        edges = corner_edge[order]
+        is_start = np.empty(n, dtype=bool)
+        is_start[0] = True
+        np.not_equal(edges[1:], edges[:-1], out=is_start[1:])
+        run_id = np.cumsum(is_start) - 1
+        run_start = np.flatnonzero(is_start)
+        run_len = np.diff(np.append(run_start, n))
+        pos = np.arange(n) - run_start[run_id]
+        size = run_len[run_id]
+        src, dst = [], []
+        for d in range(1, int(run_len.max())):
+            m = size > d
+            src.append(order[m])
+            dst.append(order[run_start[run_id[m]] + (pos[m] + d) % size[m]])
+        if not src:
+            empty = np.empty(0, dtype=np.int32)
+            return empty, empty
+        return np.concatenate(src), np.concatenate(dst)
+
+    def neighbors(self, faces):
+        # Faces sharing an edge with any of the given faces
+        pairs, _, _ = index_ranges(self.adj_offsets[faces], np.diff(self.adj_offsets)[faces])
+        return np.unique(self.adj_faces[pairs])
+
+    def flip(self, mask):
+        # Keep the analysis arrays in step with a flip; only the flipped faces are touched
+        faces = np.flatnonzero(mask)
+        self.normals[faces] *= -1
+        self.adj_same_dir ^= mask[self.pair_face] ^ mask[self.adj_faces]
+
+def index_ranges(start, total):
+    # Concatenated [start, start + total) ranges, with each index's range slot and offset
+    total = total.astype(np.int64)
+    ends = np.cumsum(total)
+    owner = np.repeat(np.arange(len(total)), total)
+    local = np.arange(ends[-1] if len(ends) else 0) - np.repeat(ends - total, total)
+    return np.repeat(start.astype(np.int64), total) + local, owner, local
+
+# Corner attribute access by data type: (property, components, dtype)
+CORNER_ATTRIBUTE_LAYOUT = {
+    'FLOAT': ('value', 1, np.float32),
+    'INT': ('value', 1, np.int32),
+    'INT8': ('value', 1, np.int32),
+    'BOOLEAN': ('value', 1, bool),
+    'FLOAT2': ('vector', 2, np.float32),
+    'INT32_2D': ('value', 2, np.int32),
+    'FLOAT_VECTOR': ('vector', 3, np.float32),
+    'FLOAT_COLOR': ('color', 4, np.float32),
+    'BYTE_COLOR': ('color_srgb', 4, np.float32),
+    'QUATERNION': ('value', 4, np.float32),
+    'FLOAT4X4': ('value', 16, np.float32),
+}
+
+def flip_mesh_faces(mesh, graph, mask):
+    # Reverse the masked faces of an Object Mode mesh in one bulk write, and flip them in graph too.
+    # Like bpy.ops.mesh.flip_normals the first corner stays put and corner data travels with its vertex,
+    # or with its edge for per-edge corner data (UV edge selection).
+    with stats.phase('write'):
+        faces = np.flatnonzero(mask)
+        if not len(faces):
+            return 0
+        corners, owner, local = index_ranges(graph.loop_start[faces], graph.loop_total[faces])
+        total = graph.loop_total[faces][owner]
+        vert_src = corners - local + (-local % total)
+        edge_src = corners - local + (total - 1 - local)
+        custom_normals = None
+        if mesh.has_custom_normals:
+            custom_normals = np.empty(len(mesh.loops) * 3, dtype=np.float32)
+            mesh.corner_normals.foreach_get('vector', custom_normals)
+            custom_normals = custom_normals.reshape(-1, 3)
+            custom_normals[corners] = -custom_normals[vert_src]
+        corner_vert = graph.corner_vert.copy()
+        corner_edge = graph.corner_edge.copy()
+        corner_vert[corners] = graph.corner_vert[vert_src]
+        corner_edge[corners] = graph.corner_edge[edge_src]
+        for attr in mesh.attributes:
+            if attr.domain != 'CORNER' or attr.name in ('.corner_vert', '.corner_edge'):
+                continue
+            layout = CORNER_ATTRIBUTE_LAYOUT.get(attr.data_type)
+            if layout is None:
+                log(f'{mesh.name} - corner attribute {attr.name} ({attr.data_type}) left unflipped')
+                continue
+            prop, size, dtype = layout
+            data = np.empty(len(attr.data) * size, dtype=dtype)
+            attr.data.foreach_get(prop, data)
+            data = data.reshape(-1, size)
+            data[corners] = data[edge_src if attr.name.startswith('.es.') else vert_src]
+            attr.data.foreach_set(prop, data.ravel())
+        mesh.loops.foreach_set('vertex_index', corner_vert)
+        mesh.loops.foreach_set('edge_index', corner_edge)
+        graph.corner_vert = corner_vert
+        graph.corner_edge = corner_edge
+        graph.flip(mask)
+        if custom_normals is not None:
+            mesh.normals_split_custom_set(custom_normals)
+        mesh.update()
+        stats.count('flipped', len(faces))
+        return len(faces)
+
+def neighbor_flip_mask(graph, faces=None):
+    # Majority vote: flip a face when more than half of its neighbors point the other way.
+    # With faces given only those are checked and every other face is left unflipped.
+    with stats.phase('vote'):
+        normals = graph.normals
+        count = np.diff(graph.adj_offsets)
+        if faces is None:
+            pair_face, adj_faces = graph.pair_face, graph.adj_faces
+        else:
+            pairs, _, _ = index_ranges(graph.adj_offsets[faces], count[faces])
+            pair_face, adj_faces = graph.pair_face[pairs], graph.adj_faces[pairs]
+        stats.count('faces_visited', graph.n_faces if faces is None else len(faces))
+        dots = np.einsum('ij,ij->i', normals[pair_face], normals[adj_faces])
+        opposite = np.bincount(pair_face[dots < 0], minlength=graph.n_faces)
+        mask = 2 * opposite > count
+        if faces is not None:
+            keep = np.zeros(graph.n_faces, dtype=bool)
+            keep[faces] = True
+            mask &= keep
+        return mask
+
+def neighbor_flip_job(graph_or_arrays):
+    graph = graph_or_arrays
+    if not isinstance(graph, FaceGraph):
+        with stats.phase('adjacency'):
+            graph = FaceGraph(**graph_or_arrays)
+    return graph, neighbor_flip_mask(graph)
+
+def neighbor_flip_objects(objects, workers=None):
+    # Neighbor check for many objects at once. Mesh reads and writes stay on the calling (main)
+    # thread while the NumPy work, which releases the GIL, runs on a thread pool; a bounded number
+    # of meshes is in flight so memory stays flat. Yields (object, faces flipped) as each is written.
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    workers = workers or os.cpu_count() or 1
+    objects = iter(objects)
+    pending = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            for obj in objects:
+                graph = analysis_cache.cached_graph(obj.data)
+                if graph is None:
+                    with stats.phase('read'):
+                        job = read_mesh_arrays(obj.data)
+                else:
+                    job = graph
+                pending[pool.submit(neighbor_flip_job, job)] = obj, graph is None
+                if len(pending) >= 2 * workers:
+                    break
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                obj, built = pending.pop(future)
+                graph, mask = future.result()
+                if built:
+                    analysis_cache.store(obj.data, graph)
+                yield obj, flip_mesh_faces(obj.data, graph, mask)
+
+def connected_labels(n, a, b):
+    # Connected components of n nodes joined by the pairs a[k], b[k], by union-find with pointer
+    # jumping: every node gets the lowest node of its component as its label
+    parent = np.arange(n, dtype=np.int32)
+    while True:
+        root_a, root_b = parent[a], parent[b]
+        split = root_a != root_b
+        if not split.any():
+            return parent
+        root_a, root_b = root_a[split], root_b[split]
+        np.minimum.at(parent, np.maximum(root_a, root_b), np.minimum(root_a, root_b))
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                break
+            parent = grand
+
+def face_islands(graph):
+    # Edge-connected islands, labelled by their lowest face index
+    with stats.phase('islands'):
+        return connected_labels(graph.n_faces, graph.pair_face, graph.adj_faces)
+
+def island_seeds(islands, score):
+    # The lowest scoring face of every island
+    order = np.lexsort((score, islands))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = islands[order][1:] != islands[order][:-1]
+    return order[first]
+
+def orient_steps(graph, seeds):
+    # Flip mask that makes every face wind consistently with the seed of its island.
+    # Breadth-first over all seeds at once: each face is reached once, taking its orientation
+    # from the shared edge it was reached through. Islands without a seed are left alone.
+    # Yields the share of faces reached after every level.
+    with stats.phase('propagate'):
+        flip = np.zeros(graph.n_faces, dtype=bool)
+        visited = np.zeros(graph.n_faces, dtype=bool)
+        claim = np.empty(graph.n_faces, dtype=np.int64)
+        count = np.diff(graph.adj_offsets)
+        frontier = np.asarray(seeds, dtype=np.int64)
+        visited[frontier] = True
+        while len(frontier):
+            pairs, _, _ = index_ranges(graph.adj_offsets[frontier], count[frontier])
+            faces = graph.adj_faces[pairs]
+            fresh = ~visited[faces]
+            pairs, faces = pairs[fresh], faces[fresh]
+            # Several frontier faces may reach the same face; one of them wins
+            slot = np.arange(len(faces))
+            claim[faces] = slot
+            first = claim[faces] == slot
+            pairs, faces = pairs[first], faces[first]
+            flip[faces] = flip[graph.pair_face[pairs]] ^ graph.adj_same_dir[pairs]
+            stats.count('faces_visited', len(faces))
+            visited[faces] = True
+            frontier = faces
+            yield np.count_nonzero(visited) / graph.n_faces
+        return flip
+
+def pair_graph(n, pair_face, adj_faces, adj_same_dir):
+    # Graph over n nodes for orient_steps from its links, given in both directions
+    order = np.argsort(pair_face, kind='stable')
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pair_face, minlength=n), out=offsets[1:])
+    return types.SimpleNamespace(n_faces=n, adj_offsets=offsets, pair_face=pair_face[order],
+                                 adj_faces=adj_faces[order], adj_same_dir=adj_same_dir[order])
+
+def read_triangles(mesh):
+    # The mesh's loop triangles as vertex index triples, and the face each triangle belongs to
+    mesh.calc_loop_triangles()
+    tris = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+    mesh.loop_triangles.foreach_get('vertices', tris)
+    tri_face = np.empty(len(mesh.loop_triangles), dtype=np.int32)
+    mesh.loop_triangles.foreach_get('polygon_index', tri_face)
+    return tris.reshape(-1, 3), tri_face
+
+def build_bvh(vert_co, tris, tri_face):
+    # Local space BVH tree over the triangles of read_triangles(), and the face of each triangle
+    with stats.phase('bvh'):
+        from mathutils.bvhtree import BVHTree
+        tree = BVHTree.FromPolygons(vert_co.tolist(), tris.tolist(), all_triangles=True)
+        return tree, tri_face
+
+def mesh_fingerprint(mesh):
+    # Element counts plus a few sampled vertex positions and edges
+    verts, edges = mesh.vertices, mesh.edges
+    key = [len(verts), len(edges), len(mesh.polygons), len(mesh.loops)]
+    for i in range(0, len(verts), max(1, len(verts) // 32)):
+        key.extend(verts[i].co)
+    for i in range(0, len(edges), max(1, len(edges) // 32)):
+        key.extend(edges[i].vertices)
+    return hash(tuple(key))
+
+class AnalysisCache:
+    # FaceGraphs, BVH trees, winding number trees and voxel grids kept per mesh datablock between runs,
+    # evicted least recently used first once they outgrow the memory budget set in the addon preferences.
+    # A depsgraph geometry update marks a mesh dirty; a dirty entry is only reused when the mesh still
+    # has exactly the corners and vertex positions of its graph (our own flips keep the two in step).
+    # Every entry's corner vertices are compared too, as undo and bulk writes without an update change
+    # the winding unnoticed, and writing a stale graph's corners back would undo them.
+    BVH_BYTES_PER_TRIANGLE = 80
+
+    def __init__(self):
+        from collections import OrderedDict
+        self.entries = OrderedDict()
+        self.dirty = set()
+        # Mirrors the Analysis Cache preference, as entries are also added from worker threads
+        self.budget_mb = 512
+
+    def clear(self):
+        self.entries.clear()
+        self.dirty.clear()
+
+    def discard(self, mesh):
+        self.entries.pop(mesh.as_pointer(), None)
+        self.dirty.discard(mesh.as_pointer())
+
+    def mark_dirty(self, mesh):
+        if mesh.as_pointer() in self.entries:
+            self.dirty.add(mesh.as_pointer())
+
+    def cached_graph(self, mesh):
+        key = mesh.as_pointer()
+        entry = self.entries.get(key)
+        if entry is None:
+            stats.count('cache_misses')
+            return None
+        with stats.phase('cache_check'):
+            graph = entry['graph']
+            stale = (entry['fingerprint'] != mesh_fingerprint(mesh) or not self.same_winding(mesh, graph)
+                     or (key in self.dirty and not self.unchanged(mesh, graph)))
+        if stale:
+            self.discard(mesh)
+            stats.count('cache_misses')
+            return None
+        self.dirty.discard(key)
+        self.entries.move_to_end(key)
+        stats.count('cache_hits')
+        return entry['graph']
+
+    def store(self, mesh, graph):
+        self.put(mesh.as_pointer(), mesh_fingerprint(mesh), graph)
+
+    def put(self, key, fingerprint, graph):
+        # Takes the key and fingerprint from when the mesh was read, so graphs built off the main
+        # thread can be stored
+        self.entries[key] = {'fingerprint': fingerprint, 'graph': graph, 'bvh': None, 'winding': None, 'voxels': None}
+        self.dirty.discard(key)
+        self._trim()
+
+    def cached_bvh(self, key, graph):
+        entry = self.entries.get(key)
+        return entry['bvh'] if entry is not None and entry['graph'] is graph else None
+
+    def bvh(self, key, graph, triangles):
+        entry = self.entries.get(key)
+        if entry is None or entry['graph'] is not graph:
+            return build_bvh(graph.vert_co, *triangles)
+        if entry['bvh'] is None:
+            entry['bvh'] = build_bvh(graph.vert_co, *triangles)
+            self._trim()
+        return entry['bvh']
+
+    def winding(self, key, graph):
+        entry = self.entries.get(key)
+        if entry is None or entry['graph'] is not graph:
+            return WindingTree(graph)
+        if entry['winding'] is None:
+            with stats.phase('winding_tree'):
+                entry['winding'] = WindingTree(graph)
+            self._trim()
+        return entry['winding']
+
+    def voxel_steps(self, key, graph, resolution, memory_mb):
+        # Built as part of the method steps, off the main thread when they run on a worker, so they
+        # yield its progress; the grid only has its size once built
+        entry = self.entries.get(key)
+        if entry is None or entry['graph'] is not graph:
+            grid = VoxelGrid(graph, resolution, memory_mb)
+            yield from grid.build_steps()
+            return grid
+        grid = entry['voxels']
+        if grid is None or (grid.resolution, grid.memory_mb) != (resolution, memory_mb):
+            grid = entry['voxels'] = VoxelGrid(graph, resolution, memory_mb)
+        if grid.sides is None:
+            yield from grid.build_steps()
+            self._trim()
+        return grid
+
+    @staticmethod
+    def same_winding(mesh, graph):
+        corner_vert = np.empty(len(mesh.loops), dtype=np.int32)
+        mesh.loops.foreach_get('vertex_index', corner_vert)
+        return np.array_equal(corner_vert, graph.corner_vert)
+
+    @staticmethod
+    def unchanged(mesh, graph):
+        # Whether the mesh still has the graph's corners, edges and vertex positions
+        arrays = read_mesh_arrays(mesh)
+        return (np.array_equal(arrays['corner_vert'], graph.corner_vert)
+                and np.array_equal(arrays['corner_edge'], graph.corner_edge)
+                and np.array_equal(arrays['vert_co'], graph.vert_co))
+
+    def _nbytes(self, entry):
+        size = sum(v.nbytes for v in vars(entry['graph']).values() if isinstance(v, np.ndarray))
+        if entry['bvh'] is not None:
+            size += len(entry['bvh'][1]) * self.BVH_BYTES_PER_TRIANGLE
+        if entry['winding'] is not None:
+            size += entry['winding'].nbytes
+        if entry['voxels'] is not None:
+            size += entry['voxels'].nbytes
+        return size
+
+    def _trim(self):
+        budget = self.budget_mb * 2 ** 20
+        total = sum(self._nbytes(entry) for entry in self.entries.values())
+        while total > budget and self.entries:
+            key, entry = self.entries.popitem(last=False)
+            self.dirty.discard(key)
+            total -= self._nbytes(entry)
+
+analysis_cache = AnalysisCache()
+
+def update_cache_mb(self, context):
+    analysis_cache.budget_mb = self.pref_cache_mb
+
+class MeshSource:
+    # A mesh as read for its analysis: its cached graph (and BVH tree) when the analysis cache has them,
+    # else the arrays to build them from. The method steps create it before their first yield, where
+    # Blender data is read on the main thread, and build what they need after it, where the NumPy and
+    # BVH work may run on a worker thread. Built parts go into the analysis cache.
+    def __init__(self, mesh, triangles=False):
+        self.key = mesh.as_pointer()
+        self.cached = analysis_cache.cached_graph(mesh)
+        self.arrays = self.fingerprint = self.triangles = None
+        if self.cached is None:
+            with stats.phase('read'):
+                self.arrays = read_mesh_arrays(mesh)
+            self.fingerprint = mesh_fingerprint(mesh)
+        self.tree = analysis_cache.cached_bvh(self.key, self.cached)
+        if triangles and self.tree is None:
+            with stats.phase('read'):
+                self.triangles = read_triangles(mesh)
+
+    def graph(self):
+        if self.cached is None:
+            with stats.phase('adjacency'):
+                self.cached = FaceGraph(**self.arrays)
+            analysis_cache.put(self.key, self.fingerprint, self.cached)
+            self.arrays = None
+        return self.cached
+
+    def target(self):
+        # The cached graph, or the bare arrays when there is none, without building a graph
+        return self.cached if self.cached is not None else MeshArrays(**self.arrays)
+
+    def bvh(self):
+        if self.tree is None:
+            self.tree = analysis_cache.bvh(self.key, self.graph(), self.triangles)
+        return self.tree
+
+    def winding(self):
+        return analysis_cache.winding(self.key, self.graph())
+
+    def voxel_steps(self, resolution, memory_mb):
+        return analysis_cache.voxel_steps(self.key, self.graph(), resolution, memory_mb)
+
+class ResultCache:
+    # Flip masks of finished runs kept on disk between sessions, so a repeat run on an identical mesh
+    # only hashes it and applies the stored flips. Files are named after a hash of the mesh's vertex
+    # positions, face sizes and corners (which carry its winding) with the method and its parameters,
+    # and hold the packed mask and the run's summary. Off unless turned on in the addon preferences or
+    # given a directory by a script or the command line; the least recently used files go first once
+    # the directory outgrows its size limit.
+    LIMIT_MB = 256
+    # Part of every key: bump it whenever a change makes any method flip differently, so results
+    # stored by earlier builds stop matching
+    RESULT_VERSION = 1
+
+    def __init__(self):
+        # Set by scripts and the command line, taking precedence over the preferences
+        self.directory = None
+        self.limit_mb = self.LIMIT_MB
+        self.hits = 0
+        self.misses = 0
+
+    def settings(self):
+        # The cache directory and its size limit in bytes; no directory when the cache is off
+        if self.directory:
+            return self.directory, self.limit_mb * 2 ** 20
+        addon = bpy.context.preferences.addons.get(__name__)
+        prefs = addon and addon.preferences
+        if not getattr(prefs, 'pref_result_cache', False):
+            return None, 0
+        directory = bpy.path.abspath(prefs.pref_result_cache_dir) if prefs.pref_result_cache_dir else \
+            bpy.utils.user_resource('DATAFILES', path='flippen_results')
+        return directory, prefs.pref_result_cache_mb * 2 ** 20
+
+    @classmethod
+    def key(cls, arrays, method, params, extra):
+        import hashlib
+        digest = hashlib.blake2b(digest_size=20)
+        # Numbers as plain floats, so NumPy scalars from the command line key like the UI's values
+        params = sorted((name, float(value) if isinstance(value, (int, float, np.number)) and not isinstance(value, bool) else value)
+                        for name, value in params.items())
+        header = (bl_info['version'], cls.RESULT_VERSION, method, params, len(arrays.vert_co), arrays.n_faces, len(arrays.corner_vert))
+        digest.update(repr(header).encode())
+        for array in (arrays.vert_co, arrays.loop_total, arrays.corner_vert, *extra):
+            digest.update(np.ascontiguousarray(array))
+        return digest.hexdigest()
+
+    def steps(self, obj, method, params, steps, selection=False, transform=False, uncached=()):
+        # The method steps behind the cache: a stored mask is handed back without running them, and a
+        # fresh one is stored once they finish. Runs with any of the uncached parameters set are not
+        # cached, nor are runs whose rays hit other objects.
+        directory, limit = self.settings()
+        if directory is None or params.get('include_others') or any(params.get(name) for name in uncached):
+            return (yield from steps)
+        mesh = obj.data
+        arrays = analysis_cache.cached_graph(mesh) or MeshArrays.from_mesh(mesh)
+        extra = []
+        if selection:
+            selected = np.zeros(len(mesh.polygons), dtype=bool)
+            mesh.polygons.foreach_get('select', selected)
+            extra.append(selected)
+        if transform:
+            extra.append(np.array(obj.matrix_world, dtype=np.float64))
+        with stats.phase('result_cache'):
+            path = os.path.join(directory, self.key(arrays, method, params, extra) + '.npz')
+            stored = self.load(path, arrays.n_faces)
+        if stored is not None:
+            steps.close()
+            self.hits += 1
+            stats.count('result_cache_hits')
+            log(f'{obj.name} - {method} flips taken from the result cache')
+            mask, result = stored
+            return arrays, mask, {**result, 'cache_hits': 1}
+        self.misses += 1
+        stats.count('result_cache_misses')
+        graph, mask, result = yield from steps
+        with stats.phase('result_cache'):
+            self.store(path, mask, result, limit)
+        return graph, mask, {**result, 'cache_misses': 1}
+
+    @staticmethod
+    def load(path, n_faces):
+        import json
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                if int(data['faces']) != n_faces:
+                    return None
+                mask = np.unpackbits(data['mask'], count=n_faces).astype(bool)
+                result = json.loads(str(data['result']))
+            # Marks the file as recently used
+            os.utime(path)
+        except Exception as error:
+            log(f'result cache: {path} unreadable ({error})')
+            return None
+        return mask, result
+
+    def store(self, path, mask, result, limit):
+        import json
+        # Memory figures and cache counts belong to the run that measured them
+        result = {k: v for k, v in result.items() if k not in ('peak_mb', 'chunks', 'cache_hits', 'cache_misses')}
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # Written aside and moved in place, as several workers may share the directory
+            temp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(temp, 'wb') as f:
+                np.savez(f, mask=np.packbits(mask), faces=len(mask), result=json.dumps(result, default=lambda v: v.item()))
+            os.replace(temp, path)
+            self.trim(directory, limit)
+        except OSError as error:
+            log(f'result cache: could not store {path} ({error})')
+
+    @staticmethod
+    def trim(directory, limit):
+        files = []
+        for entry in os.scandir(directory):
+            if entry.name.endswith('.npz'):
+                info = entry.stat()
+                files.append((info.st_mtime, info.st_size, entry.path))
+        size = sum(f[1] for f in files)
+        for mtime, file_size, path in sorted(files):
+            if size <= limit:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            size -= file_size
+
+    def clear(self):
+        directory, limit = self.settings()
+        if directory and os.path.isdir(directory):
+            self.trim(directory, 0)
+        self.hits = self.misses = 0
+
+result_cache = ResultCache()
+
+def result_cached(method, selection=False, transform=False, uncached=()):
+    # Method steps that go through the result cache, keyed by all their arguments after context and
+    # obj. Steps that read the face selection (always, or with a Scope) or the object transform (ray
+    # distances are in world units) are keyed by those as well. Runs with any argument named in
+    # uncached set give results that depend on more than the key and bypass the cache.
+    def decorate(make_steps):
+        import inspect
+        signature = inspect.signature(make_steps)
+
+        def wrapper(context, obj, *args, **kwargs):
+            bound = signature.bind(context, obj, *args, **kwargs)
+            bound.apply_defaults()
+            params = dict(list(bound.arguments.items())[2:])
+            scoped = selection or params.get('region_rings') is not None
+            return result_cache.steps(obj, method, params, make_steps(context, obj, *args, **kwargs), scoped, transform,
+                                      uncached)
+        return wrapper
+    return decorate
+
+@bpy.app.handlers.persistent
+def analysis_cache_update(scene, depsgraph):
+    for update in depsgraph.updates:
+        if not update.is_updated_geometry:
+            continue
+        data = update.id.original
+        if isinstance(data, bpy.types.Object):
+            data = data.data
+        if isinstance(data, bpy.types.Mesh):
+            analysis_cache.mark_dirty(data)
+
+@bpy.app.handlers.persistent
+def analysis_cache_clear(*args):
+    analysis_cache.clear()
+
+class RayCaster:
+    # Batched ray queries against a mesh's own BVH tree, built once in local space.
+    # Rays are given in the mesh's local space and distances in world units; other visible mesh
+    # objects are only tested when include_others is set. bvh is called for the (tree, face per
+    # triangle) pair on the first cast, so only the Blender reads here run where the caster is made.
+    def __init__(self, context, obj, bvh, include_others=False):
+        from mathutils.bvhtree import BVHTree
+        self.bvh = bvh
+        self.tree = self.tri_face = self.tri_face_list = None
+        matrix = np.array(obj.matrix_world, dtype=np.float64)
+        self.rotation = matrix[:3, :3]
+        self.translation = matrix[:3, 3]
+        self.others = []
+        if include_others:
+            depsgraph = context.evaluated_depsgraph_get()
+            for other in context.visible_objects:
+                if other.type != 'MESH' or other == obj:
+                    continue
+                inverse = np.array(other.matrix_world.inverted(), dtype=np.float64)
+                tree = BVHTree.FromObject(other.evaluated_get(depsgraph), depsgraph)
+                self.others.append((inverse[:3, :3], inverse[:3, 3], tree))
+
+    @staticmethod
+    def _cast_tree(tree, origins, directions, distances, skip=None, tri_face=None):
+        # Unit directions; returns the hit distance per ray (inf on a miss) and the hit triangle.
+        # A ray that hits its own skip face (a non-planar face it starts next to) carries on past it;
+        # skip faces are only given with tri_face, for the object's own tree.
+        hit_dist = np.full(len(origins), np.inf)
+        hit_tri = np.full(len(origins), -1, dtype=np.int32)
+        ray_cast = tree.ray_cast
+        skip = [-1] * len(origins) if skip is None else skip.tolist()
+        rays = zip(origins.tolist(), directions.tolist(), distances.tolist(), skip)
+        for i, (origin, direction, distance, skip_face) in enumerate(rays):
+            travelled = 0.0
+            loc, normal, index, dist = ray_cast(origin, direction, distance)
+            while index is not None and skip_face >= 0 and tri_face[index] == skip_face:
+                travelled += dist + 1e-5
+                origin = [c + 1e-5 * d for c, d in zip(loc, direction)]
+                loc, normal, index, dist = ray_cast(origin, direction, distance - travelled)
+            if index is not None:
+                hit_dist[i] = travelled + dist
+                hit_tri[i] = index
+        return hit_dist, hit_tri
+
+    def cast(self, origins, directions, distance, faces=None):
+        # World space hit distance per ray (inf on a miss) and the face hit on this mesh (-1 otherwise).
+        # faces gives the face each ray starts from, which the ray then cannot hit.
+        if self.tree is None:
+            self.tree, self.tri_face = self.bvh()
+            self.tri_face_list = self.tri_face.tolist()
+        with stats.phase('rays'):
+            length = np.linalg.norm(directions, axis=1)
+            world_dirs = directions @ self.rotation.T
+            world_length = np.linalg.norm(world_dirs, axis=1)
+            valid = (length > 0) & (world_length > 0)
+            hit_dist = np.full(len(origins), np.inf)
+            hit_face = np.full(len(origins), -1, dtype=np.int32)
+            if not valid.any():
+                return hit_dist, hit_face
+            stats.count('rays_cast', int(valid.sum()))
+            origins = origins[valid]
+            local_dirs = directions[valid] / length[valid, None]
+            world_dirs = world_dirs[valid] / world_length[valid, None]
+            # One local unit along each ray is local_scale world units
+            local_scale = world_length[valid] / length[valid]
+            dist, tri = self._cast_tree(self.tree, origins, local_dirs, distance / local_scale,
+                                        None if faces is None else faces[valid], self.tri_face_list)
+            dist *= local_scale
+            face = np.where(tri >= 0, self.tri_face[np.maximum(tri, 0)], -1)
+            if self.others:
+                world_origins = origins @ self.rotation.T + self.translation
+                for rotation, translation, tree in self.others:
+                    other_dirs = world_dirs @ rotation.T
+                    other_scale = np.linalg.norm(other_dirs, axis=1)
+                    other_dist, _ = self._cast_tree(tree, world_origins @ rotation.T + translation,
+                                                    other_dirs / other_scale[:, None], distance * other_scale)
+                    other_dist /= other_scale
+                    closer = other_dist < dist
+                    dist[closer] = other_dist[closer]
+                    face[closer] = -1
+            hit_dist[valid] = dist
+            hit_face[valid] = face
+            return hit_dist, hit_face
+
+def tangent_frames(normals):
+    # Orthonormal tangent and bitangent for every unit normal (Duff et al., branchless ONB)
+    sign = np.where(normals[:, 2] >= 0, 1.0, -1.0)
+    a = -1.0 / (sign + normals[:, 2])
+    b = normals[:, 0] * normals[:, 1] * a
+    tangent = np.stack([1 + sign * normals[:, 0] ** 2 * a, sign * b, -sign * normals[:, 0]], axis=1)
+    bitangent = np.stack([b, sign + normals[:, 1] ** 2 * a, -normals[:, 1]], axis=1)
+    return tangent, bitangent
+
+def ao_count_steps(caster, graph, faces, samples, distance, needed=None, seed=0):
+    # Cosine-weighted rays escaping in front of and behind each of the faces, samples per hemisphere.
+    # Sample i of every face is cast in one batch (yielding after every RAY_CHUNK faces). With needed
+    # given, a face leaves the batch once the remaining samples can no longer change whether more
+    # than needed extra rays escape behind than in front.
+    # Returns the escaped ray counts in front and behind, and the number of rays cast.
+    open_front = np.zeros(len(faces), dtype=np.int32)
+    open_back = np.zeros(len(faces), dtype=np.int32)
+    length = np.linalg.norm(graph.normals[faces], axis=1)
+    active = np.flatnonzero(length > 0)
+    normals = graph.normals[faces[active]] / length[active, None]
+    tangent, bitangent = tangent_frames(normals)
+    centers = graph.centers[faces[active]]
+    rng = np.random.default_rng(seed)
+    # Stratified in cos^2 of the polar angle, with a per-face random rotation around the normal
+    rotation = rng.random(len(active))
+    slots = np.arange(len(active))
+    rays = 0
+    for i in range(samples):
+        if not len(slots):
+            break
+        u = (i + rng.random(len(slots))) / samples
+        phi = 2 * np.pi * ((i * 0.6180339887 + rotation[slots]) % 1.0)
+        radius = np.sqrt(u)
+        side = (tangent[slots] * (radius * np.cos(phi))[:, None]
+                + bitangent[slots] * (radius * np.sin(phi))[:, None])
+        up = normals[slots] * np.sqrt(1 - u)[:, None]
+        offset = normals[slots] * 0.001
+        origin = centers[slots]
+        face = faces[active[slots]]
+        front = np.empty(len(slots))
+        back = np.empty(len(slots))
+        for start in range(0, len(slots), RAY_CHUNK):
+            part = slice(start, start + RAY_CHUNK)
+            front[part], _ = caster.cast(origin[part] + offset[part], side[part] + up[part], distance, face[part])
+            back[part], _ = caster.cast(origin[part] - offset[part], side[part] - up[part], distance, face[part])
+            yield (i + min(start + RAY_CHUNK, len(slots)) / len(slots)) / samples
+        rays += 2 * len(slots)
+        open_front[active[slots]] += np.isinf(front)
+        open_back[active[slots]] += np.isinf(back)
+        if needed is not None:
+            remaining = samples - i - 1
+            lead = open_back[active[slots]] - open_front[active[slots]]
+            slots = slots[(lead + remaining > needed) & (lead - remaining <= needed)]
+    return open_front, open_back, rays
+
+def ao_flip_steps(caster, graph, samples, distance, margin, seed=0, faces=None):
+    # Flip faces whose back hemisphere is clearly more open than the front one: more than
+    # margin * samples extra cosine-weighted rays escaping behind than in front.
+    # With faces given only those are tested. Returns the mask and the number of rays cast.
+    needed = margin * samples
+    faces = np.arange(graph.n_faces) if faces is None else faces
+    open_front, open_back, rays = yield from ao_count_steps(caster, graph, faces, samples, distance, needed, seed)
+    mask = np.zeros(graph.n_faces, dtype=bool)
+    mask[faces] = open_back - open_front > needed
+    return mask, rays
+
+def fan_triangles(graph):
+    # Corner coordinates of every face's triangle fan, (triangles, 3, 3), and the face of each triangle
+    idx, owner, _ = index_ranges(graph.loop_start, graph.loop_total - 2)
+    corners = np.stack([graph.loop_start[owner], idx + 1, idx + 2], axis=1)
+    return graph.vert_co[graph.corner_vert[corners]].astype(np.float64), owner
+
+def morton_order(points):
+    # Order of the points along a Z-order curve through their bounding box (10 bits per axis)
+    low = points.min(axis=0)
+    span = max(float((points.max(axis=0) - low).max()), 1e-12)
+    grid = np.minimum((points - low) * (1024 / span), 1023).astype(np.uint32)
+    code = np.zeros(len(points), dtype=np.uint32)
+    for axis in range(3):
+        v = grid[:, axis]
+        v = (v | (v << 16)) & 0x030000FF
+        v = (v | (v << 8)) & 0x0300F00F
+        v = (v | (v << 4)) & 0x030C30C3
+        v = (v | (v << 2)) & 0x09249249
+        code |= v << axis
+    return np.argsort(code, kind='stable')
+
+class WindingTree:
+    # Barnes-Hut tree for generalized winding numbers (Barill et al. 2018) over the fan-triangulated
+    # faces of a graph. Triangles are sorted by island, islands and the triangles inside them along a
+    # Morton curve, and ranges are halved level by level, a range holding several islands at the
+    # island boundary nearest its middle. So a node holds either whole islands or part of one, and a
+    # single traversal gives the winding number of the whole mesh and of each point's own island.
+    # Far nodes use the second order expansion of their triangles' solid angles around the node
+    # center. Node centers and radii only depend on the geometry; the expansion terms (the summed
+    # triangle area vectors and their first moments about the center) follow the faces' current
+    # winding and are only summed again when that changes.
+    LEAF_SIZE = 8
+
+    def __init__(self, graph):
+        self.islands = islands = face_islands(graph)
+        co, owner = fan_triangles(graph)
+        center = co.mean(axis=1)
+        tri_island = islands[owner]
+        m = len(owner)
+        if m:
+            curve = np.empty(m, dtype=np.int64)
+            curve[morton_order(center)] = np.arange(m)
+            # Islands in curve order of their first triangle, then the curve inside each island
+            first = np.full(len(islands), m, dtype=np.int64)
+            np.minimum.at(first, tri_island, curve)
+            order = np.lexsort((curve, first[tri_island]))
+        else:
+            order = np.empty(0, dtype=np.int64)
+        co, center, tri_island = co[order], center[order], tri_island[order]
+        self.tri_center = center
+        self.tri_reach = np.linalg.norm(co - center[:, None], axis=2).max(axis=1)
+        self.tri_co = co.astype(np.float32)
+        self.tri_face = owner[order]
+        self.tri_area = 0.5 * np.cross(co[:, 1] - co[:, 0], co[:, 2] - co[:, 0])
+        # Winding the triangles were read with; a face flipped since then has the opposite normal
+        self.face_normals = graph.normals.copy()
+        weight = np.linalg.norm(self.tri_area, axis=1) + 1e-30
+        reach = self.tri_reach
+        weight_sum = np.concatenate([[0.0], np.cumsum(weight)])
+        center_sum = np.concatenate([np.zeros((1, 3)), np.cumsum(center * weight[:, None], axis=0)])
+        island_bounds = np.flatnonzero(np.diff(tri_island)) + 1
+        # Triangle range of every island
+        self.island_range = np.zeros((len(islands), 2), dtype=np.int64)
+        if m:
+            first_tri = np.append(0, island_bounds)
+            self.island_range[tri_island[first_tri]] = np.stack([first_tri, np.append(island_bounds, m)], axis=1)
+        # Per level: first and end triangle, center, radius and first child of every node (-1 on leaves)
+        self.levels = []
+        start, end = np.zeros(min(m, 1), dtype=np.int64), np.full(min(m, 1), m, dtype=np.int64)
+        while len(start):
+            node_center = (center_sum[end] - center_sum[start]) / (weight_sum[end] - weight_sum[start])[:, None]
+            tris, owner, _ = index_ranges(start, end - start)
+            offset = np.linalg.norm(center[tris] - node_center[owner], axis=1) + reach[tris]
+            radius = np.maximum.reduceat(offset, np.cumsum(end - start) - (end - start))
+            # Split at the island boundary nearest the middle, or in the middle inside one island
+            mid = (start + end) // 2
+            k = np.searchsorted(island_bounds, mid)
+            below = island_bounds[np.maximum(k - 1, 0)] if len(island_bounds) else start
+            above = island_bounds[np.minimum(k, len(island_bounds) - 1)] if len(island_bounds) else end
+            below = np.where((below > start) & (below < end), below, -1)
+            above = np.where((above > start) & (above < end), above, -1)
+            single = (below < 0) & (above < 0)
+            split = np.where(single, mid, np.where((below >= 0) & ((above < 0) | (mid - below <= above - mid)), below, above))
+            divide = ~single | (end - start > self.LEAF_SIZE)
+            child = np.where(divide, 2 * np.cumsum(divide) - 2, -1)
+            self.levels.append((start, end, node_center, radius, child))
+            start = np.stack([start[divide], split[divide]], axis=1).ravel()
+            end = np.stack([split[divide], end[divide]], axis=1).ravel()
+        self.flipped = None
+        self.expansion = None
+
+    @property
+    def nbytes(self):
+        arrays = [self.islands, self.tri_center, self.tri_reach, self.tri_co, self.tri_face, self.tri_area,
+                  self.face_normals, self.island_range]
+        arrays += [a for level in self.levels for a in level] + [a for terms in self.expansion or [] for a in terms]
+        return sum(a.nbytes for a in arrays)
+
+    def _update(self, normals):
+        flipped = np.einsum('ij,ij->i', self.face_normals, normals) < 0
+        if self.flipped is not None and np.array_equal(flipped, self.flipped):
+            return
+        self.flipped = flipped
+        area = np.where(flipped[self.tri_face][:, None], -self.tri_area, self.tri_area)
+        area_sum = np.concatenate([np.zeros((1, 3)), np.cumsum(area, axis=0)])
+        moment = (area[:, :, None] * self.tri_center[:, None, :]).reshape(-1, 9)
+        moment_sum = np.concatenate([np.zeros((1, 9)), np.cumsum(moment, axis=0)])
+        self.expansion = []
+        for start, end, center, _, _ in self.levels:
+            dipole = area_sum[end] - area_sum[start]
+            # Sum of area (x) (triangle center - node center)
+            second = (moment_sum[end] - moment_sum[start]).reshape(-1, 3, 3) - dipole[:, :, None] * center[:, None, :]
+            self.expansion.append((dipole, second))
+
+    def winding_numbers(self, points, normals, accuracy=2.0, skip=None, island=None):
+        # Generalized winding number at every point for faces wound as in normals. Nodes and triangles
+        # farther away than accuracy times their radius use the expansion; the rest are summed exactly,
+        # leaving out the triangles of each point's skip face. With island (one per point) given, the
+        # part of the winding number coming from that island is returned as well.
+        points = np.asarray(points, dtype=np.float64)
+        whole = np.zeros(len(points))
+        own = np.zeros(len(points))
+        if self.levels:
+            self._update(normals)
+            ranges = self.island_range[island] if island is not None else None
+            point = np.arange(len(points))
+            node = np.zeros(len(points), dtype=np.int64)
+            for level, (start, end, center, radius, child) in enumerate(self.levels):
+                d = center[node] - points[point]
+                dist = np.linalg.norm(d, axis=1)
+                far = dist > accuracy * radius[node]
+                dipole, second = self.expansion[level]
+                r, length, n = d[far], dist[far], node[far]
+                angle = (np.einsum('ij,ij->i', dipole[n], r) / length ** 3
+                         + np.trace(second[n], axis1=1, axis2=2) / length ** 3
+                         - 3 * np.einsum('ij,ijk,ik->i', r, second[n], r) / length ** 5)
+                self._add(whole, own, ranges, point[far], start[n], angle)
+                point, node = point[~far], node[~far]
+                leaf = child[node] < 0
+                if leaf.any():
+                    self._leaves(whole, own, ranges, points, point[leaf], start[node[leaf]], end[node[leaf]], accuracy, skip)
+                point, node = point[~leaf], child[node[~leaf]]
+                point = np.repeat(point, 2)
+                node = (node[:, None] + np.array([0, 1])).ravel()
+        whole /= 4 * np.pi
+        if island is None:
+            return whole
+        return whole, own / (4 * np.pi)
+
+    @staticmethod
+    def _add(whole, own, ranges, point, first, angle):
+        # Nodes never straddle islands unless they hold whole ones, so a node's first triangle tells
+        # whether it belongs to the point's island
+        whole += np.bincount(point, weights=angle, minlength=len(whole))
+        if ranges is not None:
+            inside = (first >= ranges[point, 0]) & (first < ranges[point, 1])
+            own += np.bincount(point[inside], weights=angle[inside], minlength=len(own))
+
+    def _leaves(self, whole, own, ranges, points, point, start, end, accuracy, skip):
+        tris, owner, _ = index_ranges(start, end - start)
+        point = point[owner]
+        if skip is not None:
+            keep = self.tri_face[tris] != skip[point]
+            tris, point = tris[keep], point[keep]
+        r = self.tri_center[tris] - points[point]
+        length = np.linalg.norm(r, axis=1)
+        far = length > accuracy * self.tri_reach[tris]
+        sign = np.where(self.flipped[self.tri_face[tris]], -1.0, 1.0)
+        angle = np.empty(len(tris))
+        angle[far] = sign[far] * np.einsum('ij,ij->i', self.tri_area[tris[far]], r[far]) / length[far] ** 3
+        # Van Oosterom and Strackee's exact solid angle for the triangles close by
+        near = np.flatnonzero(~far)
+        stats.count('winding_triangles', len(near))
+        a, b, c = (self.tri_co[tris[near]] - points[point[near]][:, None]).transpose(1, 0, 2)
+        la, lb, lc = (np.linalg.norm(v, axis=1) for v in (a, b, c))
+        det = np.einsum('ij,ij->i', a, np.cross(b, c))
+        den = (la * lb * lc + np.einsum('ij,ij->i', a, b) * lc
+               + np.einsum('ij,ij->i', a, c) * lb + np.einsum('ij,ij->i', b, c) * la)
+        angle[near] = sign[near] * 2 * np.arctan2(det, den)
+        self._add(whole, own, ranges, point, tris, angle)
+
+def spread_samples(faces, group, low, high, singles=False):
+    # The square root of every run of faces of one group in samples (low to high), spread along the run.
+    # Runs of a single face are left out unless singles is set.
+    start = np.flatnonzero(np.diff(group, prepend=-1))
+    length = np.diff(start, append=len(faces))
+    rank = np.arange(len(faces)) - np.repeat(start, length)
+    size = np.repeat(length, length)
+    samples = np.clip(np.sqrt(size), low, high).astype(np.int64)
+    stride = np.maximum(size // samples, 1)
+    return faces[(rank % stride == 0) & (rank // stride < samples) & (singles | (size > 1))]
+
+def winding_flip_steps(tree, graph, accuracy=2.0, margin=0.2, max_passes=3):
+    # Wind every island consistently from its lowest face, then orient whole islands by the
+    # generalized winding number. Just in front of a face it is the winding number of the rest of the
+    # mesh at the face center minus one half, just behind it plus one half, and a surface separates
+    # outside (0) from inside (1) best when that rest is one half. The rest is this island's own
+    # part I and the other islands' part O; flipping the island turns O + I into O - I, so each
+    # sampled face votes by area for the sign bringing it nearer to one half, and an island flips
+    # when the vote favours flipping by more than margin. Flipping one island changes the field of
+    # the others (rooms inside a shell), so this repeats until nothing flips.
+    # Yields after every WINDING_CHUNK faces; returns the flip mask, the island count and the passes.
+    islands = tree.islands
+    seeds = island_seeds(islands, np.arange(graph.n_faces))
+    flipped = yield from orient_steps(graph, seeds)
+    graph.flip(flipped)
+    passes = 0
+    try:
+        # The square root of an island's face count in samples (8 to WINDING_SAMPLES), spread along the
+        # tree's curve; a lone face has no island of its own to tell its sides apart and is left out
+        _, first = np.unique(tree.tri_face, return_index=True)
+        faces = tree.tri_face[np.sort(first)]
+        faces = spread_samples(faces, islands[faces], 8, WINDING_SAMPLES)
+        area = graph.areas[faces]
+        centers = graph.centers[faces]
+        vote = np.empty(len(faces))
+        for passes in range(1, max_passes + 1):
+            with stats.phase('winding'):
+                for start in range(0, len(faces), WINDING_CHUNK):
+                    part = slice(start, start + WINDING_CHUNK)
+                    whole, own = tree.winding_numbers(centers[part], graph.normals, accuracy, faces[part], islands[faces[part]])
+                    other = whole - own
+                    vote[part] = np.abs(other - own - 0.5) - np.abs(other + own - 0.5)
+                    yield (passes - 1 + min(start + WINDING_CHUNK, len(faces)) / len(faces)) / max_passes
+            island_vote = np.bincount(islands[faces], weights=area * np.clip(vote, -1, 1), minlength=graph.n_faces)
+            island_area = np.bincount(islands[faces], weights=area, minlength=graph.n_faces)
+            mask = (island_vote < -margin * island_area)[islands]
+            log(f'winding pass {passes}: {np.count_nonzero(mask)} faces on the wrong side')
+            if not mask.any():
+                break
+            graph.flip(mask)
+            flipped ^= mask
+    finally:
+        graph.flip(flipped)
+    return flipped, len(seeds), passes
+
+class VoxelGrid:
+    # Solid/empty voxel grid over a graph's bounding box, for telling the two sides of faces apart.
+    # A face marks the cell in which it crosses a grid line through cell centers, so a closed surface
+    # blocks every path of face-adjacent empty cells through it. Surfaces of different islands
+    # sharing a cell are closer than the grid resolves; faces there are left for other seeds. Empty space is then flood filled in
+    # layers from outside the bounding box: layer 0 is the exterior, the surfaces bounding it and the
+    # empty space behind them layer 1, and so on. Even layers are open space (the exterior or a room
+    # inside a shell), odd layers are enclosed (inside a closed part or a wall). Only the layer found
+    # on both sides of every face is kept; the grid itself is dropped once that is known.
+    UNKNOWN = 255
+    BYTES_PER_CELL = 7                  # solid, crowded, layer, two flood masks and temporaries
+    BLOCK_CELLS = 1 << 20               # cells swept together across the first axis
+    RASTER_CHUNK = 1 << 18              # grid line crossings tested at once
+    SIDE_REACH = (0.5, 1.0, 1.5, 2.0)   # steps in cells along the normal to a face side's empty cell
+
+    def __init__(self, graph, resolution=128, memory_mb=256):
+        self.graph = graph
+        self.resolution = resolution
+        self.memory_mb = memory_mb
+        self.used_resolution = None
+        self.cells = 0
+        self.face_normals = None
+        self.sides = None
+
+    @property
+    def nbytes(self):
+        return 0 if self.sides is None else self.sides.nbytes + self.face_normals.nbytes
+
+    def build_steps(self):
+        # Yields progress while rasterizing and flood filling; does nothing once built
+        if self.sides is not None:
+            return
+        graph = self.graph
+        co, owner = fan_triangles(graph)
+        if not len(co):
+            self.face_normals = graph.normals.copy()
+            self.sides = np.full((graph.n_faces, 2), self.UNKNOWN, dtype=np.uint8)
+            return
+        low, high = co.min(axis=(0, 1)), co.max(axis=(0, 1))
+        longest = max(float((high - low).max()), 1e-6)
+        # Lower the resolution until the grid, with empty cells of padding around it, fits the cap
+        overhead = 48 * self.RASTER_CHUNK
+        max_cells = max((self.memory_mb * 2 ** 20 - overhead) // self.BYTES_PER_CELL, 27)
+        resolution = self.resolution
+        while True:
+            cell = longest / resolution
+            shape = tuple(np.floor((high - low) / cell).astype(np.int64) + 3)
+            size = int(np.prod(shape))
+            if size <= max_cells or resolution <= 1:
+                break
+            resolution = min(resolution - 1, max(1, int(resolution * (max_cells / size) ** (1 / 3))))
+        if resolution < self.resolution:
+            log(f'voxel grid lowered to {resolution} cells across to stay under {self.memory_mb} MB')
+        self.used_resolution = resolution
+        self.cells = size
+        stats.count('voxel_cells', size)
+        origin = low - cell
+        tri = (co - origin) / cell
+        del co
+        solid = np.zeros(shape, dtype=bool)
+        crowded = np.zeros(shape, dtype=bool)
+        # While rasterizing, the layer array holds a tag of the island that marked each cell
+        layer = np.zeros(shape, dtype=np.uint8)
+        tri_tag = (face_islands(graph)[owner] % (self.UNKNOWN - 1) + 1).astype(np.uint8)
+        with stats.phase('voxelize'):
+            for axis in range(3):
+                yield from self._rasterize(solid, crowded, layer, tri, tri_tag, axis, axis / 6)
+        del tri, tri_tag
+        with stats.phase('flood_fill'):
+            layer.fill(self.UNKNOWN)
+            passable = ~solid
+            n_free = max(np.count_nonzero(passable), 1)
+            reached = np.zeros(shape, dtype=bool)
+            for axis in range(3):
+                reached[(slice(None),) * axis + (0,)] = True
+                reached[(slice(None),) * axis + (-1,)] = True
+            reached &= passable
+            labeled = 0
+            k = 0
+            while True:
+                for _ in self._flood(reached, passable):
+                    yield 0.5 + 0.5 * (labeled + np.count_nonzero(reached)) / n_free
+                layer[reached] = k
+                labeled += np.count_nonzero(reached)
+                if k + 1 >= self.UNKNOWN:
+                    break
+                # The surfaces bounding this layer's empty space, then the empty space behind them
+                passable = solid & (layer == self.UNKNOWN)
+                reached = self._touching(reached) & passable
+                if not reached.any():
+                    break
+                for _ in self._flood(reached, passable):
+                    yield 0.5 + 0.5 * labeled / n_free
+                layer[reached] = k
+                passable = ~solid & (layer == self.UNKNOWN)
+                reached = self._touching(reached) & passable
+                if not reached.any():
+                    break
+                k += 1
+            del passable, reached
+        # The layer of the first empty cell in front of and behind every face. A face's own cells lie
+        # within half its normal's component sum of its plane; a solid cell farther out belongs to
+        # another surface closer than the grid resolves, and so does a cell two islands marked. Either
+        # leaves that side unknown.
+        sides = np.full((graph.n_faces, 2), self.UNKNOWN, dtype=np.uint8)
+        centers = (graph.centers - origin) / cell
+        own = 0.5 * np.abs(graph.normals).sum(axis=1) + 0.05
+        limit = np.array(shape) - 1
+        start = crowded[tuple(np.clip(np.floor(centers).astype(np.int64), 0, limit).T)]
+        for column, sign in enumerate((1.0, -1.0)):
+            direction = sign * graph.normals
+            searching = ~start
+            for reach in self.SIDE_REACH:
+                p = np.clip(np.floor(centers + reach * direction).astype(np.int64), 0, limit)
+                index = tuple(p.T)
+                empty = ~solid[index]
+                found = searching & empty
+                sides[found, column] = layer[index][found]
+                beyond = np.einsum('ij,ij->i', p + 0.5 - centers, direction) > own
+                searching &= ~empty & ~beyond & ~crowded[index]
+        self.face_normals = graph.normals.copy()
+        self.sides = sides
+
+    def _rasterize(self, solid, crowded, tags, tri, tri_tag, axis, progress):
+        # Mark the cells where triangles cross the grid lines parallel to axis, and the cells marked
+        # by triangles of differently tagged islands as crowded
+        b, c = (axis + 1) % 3, (axis + 2) % 3
+        flat = tri[:, :, [b, c]]
+        lo = np.ceil(flat.min(axis=1) - 0.5).astype(np.int64)
+        count = np.maximum(np.floor(flat.max(axis=1) - 0.5).astype(np.int64) - lo + 1, 0)
+        lines = count[:, 0] * count[:, 1]
+        ends = np.cumsum(lines)
+        start = 0
+        while start < len(tri):
+            # Whole triangles, up to about RASTER_CHUNK crossings
+            base = ends[start - 1] if start else 0
+            end = max(int(np.searchsorted(ends, base + self.RASTER_CHUNK, side='right')), start + 1)
+            part = slice(start, end)
+            _, owner, local = index_ranges(np.zeros(end - start), lines[part])
+            owner += start
+            j = lo[owner, 0] + local // count[owner, 1]
+            k = lo[owner, 1] + local % count[owner, 1]
+            p = tri[owner]
+            # Barycentric weights of the line in the triangle's projection along axis
+            x0, y0 = p[:, 0, b], p[:, 0, c]
+            e1 = p[:, 1] - p[:, 0]
+            e2 = p[:, 2] - p[:, 0]
+            det = e1[:, b] * e2[:, c] - e2[:, b] * e1[:, c]
+            flat_tri = np.abs(det) < 1e-12
+            det = np.where(flat_tri, 1.0, det)
+            u = ((j + 0.5 - x0) * e2[:, c] - e2[:, b] * (k + 0.5 - y0)) / det
+            v = (e1[:, b] * (k + 0.5 - y0) - (j + 0.5 - x0) * e1[:, c]) / det
+            hit = ~flat_tri & (u >= -1e-9) & (v >= -1e-9) & (u + v <= 1 + 1e-9)
+            i = np.floor(p[:, 0, axis] + u * e1[:, axis] + v * e2[:, axis]).astype(np.int64)
+            index = [None] * 3
+            index[axis] = np.clip(i[hit], 0, solid.shape[axis] - 1)
+            index[b], index[c] = j[hit], k[hit]
+            cells = np.ravel_multi_index(tuple(index), solid.shape)
+            tag = tri_tag[owner[hit]]
+            order = np.lexsort((tag, cells))
+            cells, tag = cells[order], tag[order]
+            held = tags.flat[cells]
+            crowded.flat[cells[(held != 0) & (held != tag)]] = True
+            crowded.flat[cells[1:][(cells[1:] == cells[:-1]) & (tag[1:] != tag[:-1])]] = True
+            tags.flat[cells] = tag
+            solid.flat[cells] = True
+            start = end
+            yield progress + end / len(tri) / 6
+
+    def _flood(self, reached, passable):
+        # Grow reached through passable cells, one axis at a time, until it stops growing
+        count = np.count_nonzero(reached)
+        while True:
+            for axis in range(3):
+                self._sweep(reached, passable, axis)
+                stats.count('flood_sweeps')
+                yield
+            grown = np.count_nonzero(reached)
+            if grown == count:
+                return
+            count = grown
+
+    def _sweep(self, reached, passable, axis):
+        # Carry reached along every line parallel to axis, forward and then back, through passable
+        # cells. Lines across the first axis are done a block of it at a time to stay in cache.
+        block = len(reached) if axis == 0 else max(1, self.BLOCK_CELLS // reached[0].size)
+        for k in range(0, len(reached), block):
+            r = np.moveaxis(reached[k:k + block], axis, 0)
+            p = np.moveaxis(passable[k:k + block], axis, 0)
+            for i in range(1, len(r)):
+                r[i] |= r[i - 1] & p[i]
+            for i in range(len(r) - 2, -1, -1):
+                r[i] |= r[i + 1] & p[i]
+
+    @staticmethod
+    def _touching(mask):
+        # The mask grown by one cell across every cell face
+        grown = mask.copy()
+        for axis in range(3):
+            lead = (slice(None),) * axis
+            grown[lead + (slice(1, None),)] |= mask[lead + (slice(None, -1),)]
+            grown[lead + (slice(None, -1),)] |= mask[lead + (slice(1, None),)]
+        return grown
+
+    def face_scores(self, normals):
+        # +1 where a face's front is open space and its back enclosed, -1 the other way round. A side
+        # without an empty cell nearby (a thick or merged wall) counts as enclosed against the exterior.
+        # 0 where the grid cannot tell (open sheets, surfaces finer than the grid).
+        flipped = np.einsum('ij,ij->i', self.face_normals, normals) < 0
+        front = np.where(flipped, self.sides[:, 1], self.sides[:, 0])
+        back = np.where(flipped, self.sides[:, 0], self.sides[:, 1])
+        front_known, back_known = front != self.UNKNOWN, back != self.UNKNOWN
+        front_open, back_open = front_known & (front % 2 == 0), back_known & (back % 2 == 0)
+        front_enclosed, back_enclosed = front_known & ~front_open, back_known & ~back_open
+        out = front_open & (back_enclosed | (~back_known & (front == 0)))
+        into = back_open & (front_enclosed | (~front_known & (back == 0)))
+        return out.astype(np.int8) - into
+
+def face_patches(graph, sharp_angle):
+    # Maximal consistently wound patches: faces joined across manifold edges where their windings
+    # agree and their normals turn by less than sharp_angle. Labels are the lowest face of each patch.
+    with stats.phase('patches'):
+        users = np.bincount(graph.corner_edge)
+        turn = np.einsum('ij,ij->i', graph.normals[graph.pair_face], graph.normals[graph.adj_faces])
+        join = (users[graph.adj_edge] == 2) & ~graph.adj_same_dir & (turn > np.cos(sharp_angle))
+        return connected_labels(graph.n_faces, graph.pair_face[join], graph.adj_faces[join])
+
+def edge_lengths(graph):
+    # Length of every edge, indexed like corner_edge
+    following = np.arange(1, len(graph.corner_vert) + 1)
+    following[graph.loop_start + graph.loop_total - 1] = graph.loop_start
+    length = np.zeros(int(graph.corner_edge.max()) + 1 if len(graph.corner_edge) else 0)
+    co = graph.vert_co
+    length[graph.corner_edge] = np.linalg.norm(co[graph.corner_vert[following]] - co[graph.corner_vert], axis=1)
+    return length
+
+def min_cut(source, sink, a, b, weight):
+    # Minimum cut between a source and a sink by Dinic's algorithm, over nodes tied to the source by
+    # source[i], to the sink by sink[i] and to each other by weight[k] between a[k] and b[k] (both
+    # ways). Returns a mask of the nodes on the sink side.
+    from collections import deque
+    n = len(source)
+    s, t = n, n + 1
+    # Flow straight from the source through a node to the sink needs no search
+    through = np.minimum(source, sink)
+    source, sink = source - through, sink - through
+    tied = np.flatnonzero(source > 0)
+    drained = np.flatnonzero(sink > 0)
+    u = np.concatenate([np.full(len(tied), s), a, drained])
+    v = np.concatenate([tied, b, np.full(len(drained), t)])
+    forward = np.concatenate([source[tied], weight, sink[drained]])
+    backward = np.concatenate([np.zeros(len(tied)), weight, np.zeros(len(drained))])
+    # Arc 2k runs u -> v and arc 2k + 1 back, so every arc's reverse is arc ^ 1
+    tail = np.stack([u, v], axis=1).ravel()
+    head = np.stack([v, u], axis=1).ravel().tolist()
+    cap = np.stack([forward, backward], axis=1).ravel().tolist()
+    order = np.argsort(tail, kind='stable')
+    bounds = np.searchsorted(tail[order], np.arange(n + 3))
+    arcs = [order[bounds[x]:bounds[x + 1]].tolist() for x in range(n + 2)]
+    eps = 1e-12 * max(max(cap, default=0.0), 1e-300)
+
+    def levels():
+        level = [-1] * (n + 2)
+        level[s] = 0
+        queue = deque([s])
+        while queue:
+            x = queue.popleft()
+            for e in arcs[x]:
+                if cap[e] > eps and level[head[e]] < 0:
+                    level[head[e]] = level[x] + 1
+                    queue.append(head[e])
+        return level
+
+    with stats.phase('min_cut'):
+        while True:
+            level = levels()
+            if level[t] < 0:
+                break
+            # Blocking flow: walk down the levels, retreating from dead ends, and augment at the sink
+            next_arc = [0] * (n + 2)
+            path = []
+            x = s
+            while True:
+                if x == t:
+                    pushed = min(cap[e] for e in path)
+                    for e in path:
+                        cap[e] -= pushed
+                        cap[e ^ 1] += pushed
+                    path = []
+                    x = s
+                    continue
+                out = arcs[x]
+                while next_arc[x] < len(out):
+                    e = out[next_arc[x]]
+                    if cap[e] > eps and level[head[e]] == level[x] + 1:
+                        break
+                    next_arc[x] += 1
+                else:
+                    if x == s:
+                        break
+                    level[x] = -1
+                    e = path.pop()
+                    x = head[e ^ 1]
+                    next_arc[x] += 1
+                    continue
+                path.append(e)
+                x = head[e]
+        return np.array(levels()[:n]) < 0
+
+def patch_flip_steps(caster, graph, samples=8, distance=0.5, sharp_angle=np.radians(60), smoothness=1.0, fixed=None):
+    # Orientation decided per patch (face_patches) rather than per face. Every patch gets ray evidence
+    # from up to PATCH_SAMPLES of its faces (the AO comparison of the two hemispheres, by area), and
+    # neighbouring patches want to be wound alike across the edges they share, by edge length and how
+    # smoothly the surface carries on there. The flip bit of every patch then comes from a minimum cut
+    # over the patch graph, after flipping the patch labels to a breadth-first consistent winding so
+    # that all wishes are to be alike. Wishes that contradict each other around a loop (non-orientable
+    # surfaces) cannot be cut that way and are left out. Patches holding a fixed face (given as a mask)
+    # keep their winding and cast no rays.
+    # Yields while casting rays; returns the flip mask, the patch count and the rays cast.
+    labels, patch = np.unique(face_patches(graph, sharp_angle), return_inverse=True)
+    patch = patch.ravel()
+    n = len(labels)
+    stats.count('patches', n)
+    pinned = np.zeros(n, dtype=bool) if fixed is None else np.bincount(patch, weights=fixed, minlength=n) > 0
+    area = np.bincount(patch, weights=graph.areas, minlength=n)
+    # Single face patches need their ray evidence as much as any other
+    order = np.argsort(patch, kind='stable')
+    faces = spread_samples(order, patch[order], 1, PATCH_SAMPLES, singles=True)
+    faces = faces[~pinned[patch[faces]]]
+    open_front, open_back, rays = yield from progress_range(
+        ao_count_steps(caster, graph, faces, samples, distance), 0.0, 0.9)
+    sampled = np.bincount(patch[faces], weights=graph.areas[faces], minlength=n)
+    # Positive where the patch is more open in front, scaled from its samples up to its whole area
+    evidence = np.bincount(patch[faces], weights=(open_front - open_back) / samples * graph.areas[faces], minlength=n)
+    evidence = evidence * area / np.maximum(sampled, 1e-30)
+    yield 0.9
+    # Patch pairs across manifold edges, each edge once
+    users = np.bincount(graph.corner_edge)
+    a, b = patch[graph.pair_face], patch[graph.adj_faces]
+    keep = (a < b) & (users[graph.adj_edge] == 2)
+    a, b = a[keep], b[keep]
+    differ = graph.adj_same_dir[keep]
+    turn = np.einsum('ij,ij->i', graph.normals[graph.pair_face[keep]], graph.normals[graph.adj_faces[keep]])
+    turn = np.where(differ, -turn, turn)
+    scale = np.sqrt(area.sum() / max(graph.n_faces, 1))
+    weight = smoothness * scale * edge_lengths(graph)[graph.adj_edge[keep]] * (1 + turn) / 2
+    # Breadth-first winding over the patch graph: flipping the patches in gauge makes every wish on a
+    # consistent loop a wish to be alike
+    patch_graph = pair_graph(n, np.concatenate([a, b]), np.concatenate([b, a]), np.concatenate([differ, differ]))
+    gauge = finish(orient_steps(patch_graph, island_seeds(connected_labels(n, a, b), np.arange(n))))
+    alike = differ == (gauge[a] ^ gauge[b])
+    stats.count('frustrated_edges', int(np.count_nonzero(~alike)))
+    # Cost of flipping or keeping every patch; ties keep the current winding
+    cost_flip = np.maximum(evidence, 0) + 1e-6 * area
+    cost_keep = np.maximum(-evidence, 0)
+    # More than any cut through the other patches could cost
+    cost_flip[pinned] = np.abs(evidence).sum() + weight.sum() + area.sum() + 1
+    flip_gauge = min_cut(np.where(gauge, cost_keep, cost_flip), np.where(gauge, cost_flip, cost_keep),
+                         a[alike], b[alike], weight[alike])
+    return (flip_gauge ^ gauge)[patch], n, rays
+
+def persistent_flip_steps(graph, max_passes=5, incremental=True, movable=None):
+    # Repeat the neighbor check until nothing flips, returning the net flip mask and
+    # (faces checked, faces flipped) per pass. Yields after every pass.
+    # Incremental mode runs to convergence: after the first full pass a face's vote can only
+    # change if it or a neighbor flipped, so only those faces are checked again.
+    # With a movable mask given only those faces are checked and flipped.
+    flipped = np.zeros(graph.n_faces, dtype=bool)
+    passes = []
+    candidates = None if movable is None else np.flatnonzero(movable)
+    last_flipped = None
+    try:
+        while incremental or len(passes) < max_passes:
+            checked = graph.n_faces if candidates is None else len(candidates)
+            mask = neighbor_flip_mask(graph, candidates)
+            faces = np.flatnonzero(mask)
+            if not len(faces):
+                break
+            if incremental and last_flipped is not None and np.array_equal(faces, last_flipped):
+                # Synchronous majority voting ends in a fixed point or a two-cycle; this is the cycle
+                log(f'pass {len(passes) + 1}: oscillating between two states, stopping')
+                break
+            graph.flip(mask)
+            flipped ^= mask
+            passes.append((checked, len(faces)))
+            stats.count('passes')
+            log(f'pass {len(passes)}: {checked} faces checked, {len(faces)} flipped')
+            if incremental:
+                candidates = np.union1d(faces, graph.neighbors(faces))
+                if movable is not None:
+                    candidates = candidates[movable[candidates]]
+                last_flipped = faces
+                yield 1 - len(candidates) / graph.n_faces
+            else:
+                yield len(passes) / max_passes
+    finally:
+        # Leave the graph describing the mesh as it still is, also when the run is cancelled;
+        # flip_mesh_faces applies the net result
+        graph.flip(flipped)
+    return flipped, passes
+
+class MemoryTrace:
+    # Memory allocated through Python and NumPy since the trace started, from tracemalloc; Blender's own
+    # data such as the mesh itself is not seen. peak covers the whole trace and window_peak() the part
+    # since the last new_window(), or the whole trace again when tracemalloc was already running.
+    def __init__(self):
+        import tracemalloc
+        self.tracemalloc = tracemalloc
+        self.owner = not tracemalloc.is_tracing()
+        if self.owner:
+            tracemalloc.start()
+        self.base = tracemalloc.get_traced_memory()[0]
+        self.peak = 0
+
+    def current(self):
+        return self.tracemalloc.get_traced_memory()[0] - self.base
+
+    def window_peak(self):
+        return self.tracemalloc.get_traced_memory()[1] - self.base
+
+    def new_window(self):
+        self.peak = max(self.peak, self.window_peak())
+        if self.owner:
+            self.tracemalloc.reset_peak()
+
+    def close(self):
+        self.new_window()
+        if self.owner:
+            self.tracemalloc.stop()
+
+class MeshArrays:
+    # A mesh held only as the compact arrays of read_mesh_arrays, for working on parts of it without a
+    # FaceGraph of the whole. Stands in for the FaceGraph when the flips are written back.
+    def __init__(self, loop_start, loop_total, normals, corner_vert, corner_edge, vert_co):
+        self.n_faces = len(loop_start)
+        self.loop_start = loop_start
+        self.loop_total = loop_total
+        self.normals = normals
+        self.corner_vert = corner_vert
+        self.corner_edge = corner_edge
+        self.vert_co = vert_co
+
+    @classmethod
+    def from_mesh(cls, mesh, **kwargs):
+        with stats.phase('read'):
+            return cls(**read_mesh_arrays(mesh), **kwargs)
+
+    def centers(self, faces):
+        corners, _, _ = index_ranges(self.loop_start[faces], self.loop_total[faces])
+        total = self.loop_total[faces]
+        sums = np.add.reduceat(self.vert_co[self.corner_vert[corners]], np.cumsum(total) - total, axis=0)
+        return sums / total[:, None]
+
+    def subgraph(self, faces):
+        # FaceGraph of the faces in the given order; vertex and edge indices stay those of the whole mesh
+        corners, _, _ = index_ranges(self.loop_start[faces], self.loop_total[faces])
+        total = self.loop_total[faces]
+        with stats.phase('adjacency'):
+            return FaceGraph((np.cumsum(total) - total).astype(np.int32), total, self.normals[faces],
+                             self.corner_vert[corners], self.corner_edge[corners], self.vert_co)
+
+    def halo(self, core, rings):
+        # The core faces followed by every face up to rings shared edges away from them, ring by ring
+        inside = np.zeros(self.n_faces, dtype=bool)
+        inside[core] = True
+        edges = np.zeros(int(self.corner_edge.max()) + 1 if len(self.corner_edge) else 0, dtype=bool)
+        parts = [core]
+        for _ in range(rings):
+            corners, _, _ = index_ranges(self.loop_start[parts[-1]], self.loop_total[parts[-1]])
+            edges[self.corner_edge[corners]] = True
+            fresh = self.touching(edges, inside)
+            if not len(fresh):
+                break
+            inside[fresh] = True
+            parts.append(fresh)
+        return np.concatenate(parts)
+
+    def touching(self, edges, inside):
+        # Faces outside inside with a corner on one of the marked edges
+        if not self.n_faces:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(np.logical_or.reduceat(edges[self.corner_edge], self.loop_start) & ~inside)
+
+    def flip(self, mask):
+        self.normals[mask] *= -1
+
+class MeshChunks(MeshArrays):
+    # A mesh worked through chunk by chunk, for meshes too large to keep a FaceGraph of (Low Memory mode).
+    # Chunks are runs of faces along a Morton curve through the face centers, so each is spatially
+    # compact, and come with rings of halo faces around them, found through an edge to corner index.
+    # Each chunk is sized to what is left of the memory budget, from the memory the previous one took
+    # per corner.
+    BLOCK_FACES = 1 << 18
+    MIN_FACES = 1024
+    BYTES_PER_CORNER = 160
+
+    def __init__(self, loop_start, loop_total, normals, corner_vert, corner_edge, vert_co, budget):
+        super().__init__(loop_start, loop_total, normals, corner_vert, corner_edge, vert_co)
+        self.budget = budget
+        self.count = 0
+        self.corners_per_face = len(corner_vert) / max(self.n_faces, 1)
+        self.block_faces = self.BLOCK_FACES
+        n_edges = int(corner_edge.max()) + 1 if len(corner_edge) else 0
+        self.edge_offsets = np.zeros(n_edges + 1, dtype=np.int64)
+        np.cumsum(np.bincount(corner_edge, minlength=n_edges), out=self.edge_offsets[1:])
+        self.edge_corners = np.argsort(corner_edge, kind='stable').astype(np.int32)
+        centers = np.empty((self.n_faces, 3), dtype=np.float32)
+        for faces in self.blocks():
+            centers[faces] = self.centers(faces)
+        self.order = morton_order(centers).astype(np.int32) if self.n_faces else np.empty(0, dtype=np.int32)
+
+    def blocks(self):
+        # Consecutive faces in blocks no larger than the last chunk, for whole mesh passes
+        for start in range(0, self.n_faces, self.block_faces):
+            yield np.arange(start, min(start + self.block_faces, self.n_faces))
+
+    def touching(self, edges, inside):
+        # Only the corners of the marked edges are looked at, so a ring costs what it holds
+        marked = np.flatnonzero(edges)
+        edges[marked] = False
+        users, _, _ = index_ranges(self.edge_offsets[marked], self.edge_offsets[marked + 1] - self.edge_offsets[marked])
+        touching = np.zeros(self.n_faces, dtype=bool)
+        touching[np.searchsorted(self.loop_start, self.edge_corners[users], side='right') - 1] = True
+        return np.flatnonzero(touching & ~inside)
+
+    def runs(self, trace, rings):
+        # (core faces, core and halo faces) of every chunk in turn, the next one sized once the caller
+        # is done with the last
+        per_corner = self.BYTES_PER_CORNER
+        start = 0
+        while start < self.n_faces:
+            # A tenth of what is left stays in reserve for the estimate being off
+            room = 0.9 * (self.budget - trace.current()) / (per_corner * self.corners_per_face)
+            size = max(int(room), self.MIN_FACES)
+            self.block_faces = min(size, self.BLOCK_FACES)
+            core = np.sort(self.order[start:start + size])
+            trace.new_window()
+            before = trace.current()
+            yield core, self.halo(core, rings)
+            per_corner = max((trace.window_peak() - before) / (len(core) * self.corners_per_face), 1.0)
+            self.count += 1
+            stats.count('chunks')
+            start += len(core)
+
+def chunked_steps(obj, budget_mb, rings, solve):
+    # Low Memory steps for methods that only look a few rings of faces around each face. The mesh is read
+    # into MeshChunks (dropping its cached analysis) and solve(graph) gives the steps for the FaceGraph of
+    # one chunk and its halo, returning their flip mask and a dict of counts; only the flips of the
+    # chunk's own faces are kept. Returns the MeshChunks, the flip mask and a result with the summed
+    # counts (the most passes any chunk took for passes), the number of chunks and the peak memory in MB.
+    trace = MemoryTrace()
+    try:
+        analysis_cache.discard(obj.data)
+        with stats.phase('read'):
+            arrays = read_mesh_arrays(obj.data)
+        yield 0.0
+        chunks = MeshChunks(**arrays, budget=budget_mb * 2 ** 20)
+        del arrays
+        n = max(chunks.n_faces, 1)
+        mask = np.zeros(chunks.n_faces, dtype=bool)
+        result = {'faces': chunks.n_faces}
+        done = 0
+        for core, faces in chunks.runs(trace, rings):
+            local, counts = yield from progress_range(solve(chunks.subgraph(faces)), done / n, (done + len(core)) / n)
+            mask[core] = local[:len(core)]
+            for key, value in counts.items():
+                result[key] = max(result.get(key, 0), value) if key == 'passes' else result.get(key, 0) + value
+            done += len(core)
+            yield done / n
+    finally:
+        trace.close()
+    result.update(chunks=chunks.count, peak_mb=round(trace.peak / 2 ** 20, 1))
+    return chunks, mask, result
+
+def chunked_orient_steps(obj, budget_mb, pick_seeds):
+    # Low Memory orientation: the pieces of every chunk are made consistent on their own, then joined
+    # across the chunk seams into whole islands by a breadth-first winding over the graph of pieces, and
+    # every island is turned to agree with the seed face pick_seeds(chunks, islands) gives it. Islands
+    # without a seed are left alone. Returns like chunked_steps, with the islands counted.
+    trace = MemoryTrace()
+    try:
+        analysis_cache.discard(obj.data)
+        with stats.phase('read'):
+            arrays = read_mesh_arrays(obj.data)
+        yield 0.0
+        chunks = MeshChunks(**arrays, budget=budget_mb * 2 ** 20)
+        del arrays
+        n = max(chunks.n_faces, 1)
+        flip = np.zeros(chunks.n_faces, dtype=bool)
+        piece = np.zeros(chunks.n_faces, dtype=np.int32)
+        seams = [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=bool))]
+        done = 0
+        for core, faces in chunks.runs(trace, 1):
+            graph = chunks.subgraph(faces)
+            k = len(core)
+            inner = (graph.pair_face < k) & (graph.adj_faces < k)
+            a, b = graph.pair_face[inner], graph.adj_faces[inner]
+            local = connected_labels(k, a, b)
+            # Pieces are named after their lowest face in the whole mesh
+            piece[core] = core[local]
+            steps = orient_steps(pair_graph(k, a, b, graph.adj_same_dir[inner]), np.flatnonzero(local == np.arange(k)))
+            flip[core] = yield from progress_range(steps, 0.9 * done / n, 0.9 * (done + k) / n)
+            # Pairs across the seam, each taken from the chunk of its lower face
+            seam = (graph.pair_face < k) & (graph.adj_faces >= k)
+            f, g = faces[graph.pair_face[seam]], faces[graph.adj_faces[seam]]
+            lower = f < g
+            seams.append((f[lower], g[lower], graph.adj_same_dir[seam][lower]))
+            done += k
+        f, g, same_dir = (np.concatenate(part) for part in zip(*seams))
+        del seams
+        # Pieces wind alike across a seam unless their faces, as flipped so far, disagree there
+        with stats.phase('stitch'):
+            pieces = np.flatnonzero(piece == np.arange(chunks.n_faces))
+            node = np.zeros(chunks.n_faces, dtype=np.int32)
+            node[pieces] = np.arange(len(pieces))
+            node = node[piece]
+            del piece
+            a, b = node[f], node[g]
+            differ = same_dir ^ flip[f] ^ flip[g]
+            labels = connected_labels(len(pieces), a, b)
+            graph = pair_graph(len(pieces), np.concatenate([a, b]), np.concatenate([b, a]), np.concatenate([differ, differ]))
+            flip ^= finish(orient_steps(graph, island_seeds(labels, np.arange(len(pieces)))))[node]
+            islands = labels[node]
+        yield 0.95
+        seeds = pick_seeds(chunks, islands)
+        turn = np.zeros(len(pieces), dtype=bool)
+        seeded = np.zeros(len(pieces), dtype=bool)
+        turn[islands[seeds]] = flip[seeds]
+        seeded[islands[seeds]] = True
+        mask = (flip ^ turn[islands]) & seeded[islands]
+    finally:
+        trace.close()
+    result = {'faces': chunks.n_faces, 'islands': len(np.unique(labels)), 'seeds': len(seeds),
+              'chunks': chunks.count, 'peak_mb': round(trace.peak / 2 ** 20, 1)}
+    return chunks, mask, result
+
+def corner_distance(graph, islands):
+    # Distance of every face center from its island's bounding box min corner
+    min_corner = np.full((graph.n_faces, 3), np.inf, dtype=np.float32)
+    np.minimum.at(min_corner, islands[graph.corner_face], graph.vert_co[graph.corner_vert])
+    return np.linalg.norm(graph.centers - min_corner[islands], axis=1)
+
+def corner_seeds(chunks, islands):
+    # The face of every island nearest the island's bounding box min corner, a point outside the mesh,
+    # worked out block by block
+    size = int(islands.max()) + 1 if len(islands) else 0
+    min_corner = np.full((size, 3), np.inf, dtype=np.float32)
+    for faces in chunks.blocks():
+        corners, owner, _ = index_ranges(chunks.loop_start[faces], chunks.loop_total[faces])
+        np.minimum.at(min_corner, islands[faces][owner], chunks.vert_co[chunks.corner_vert[corners]])
+    best = np.full(size, np.inf)
+    seed = np.full(size, -1, dtype=np.int64)
+    for faces in chunks.blocks():
+        distance = np.linalg.norm(chunks.centers(faces) - min_corner[islands[faces]], axis=1)
+        first = island_seeds(islands[faces], distance)
+        island, distance = islands[faces[first]], distance[first]
+        closer = distance < best[island]
+        best[island[closer]] = distance[closer]
+        seed[island[closer]] = faces[first[closer]]
+    return seed[seed >= 0]
+
+class Region:
+    # The selected faces of a mesh and rings of context faces around them, for working on just that part
+    # (the Scope option). graph is the FaceGraph of the region alone, selected faces first, and faces
+    # the index of each of its faces in the whole mesh; the context faces stand in for the rest of the
+    # mesh and are never flipped. A cached graph of the whole mesh is used when there is one (with whole set, one
+    # is built), else only the mesh arrays are read; the flips are written back through either.
+    # Like a MeshSource it is made before the method steps' first yield and built after it.
+    def __init__(self, source, selected, rings, whole=False):
+        self.source = source
+        self.selected = selected
+        self.rings = rings
+        self.whole = whole
+
+    @classmethod
+    def from_mesh(cls, mesh, rings, whole=False):
+        selected = np.zeros(len(mesh.polygons), dtype=bool)
+        mesh.polygons.foreach_get('select', selected)
+        return cls(MeshSource(mesh), selected, rings, whole)
+
+    def build(self):
+        target = self.target = self.source.graph() if self.whole else self.source.target()
+        self.arrays = target if isinstance(target, MeshArrays) else MeshArrays(
+            target.loop_start, target.loop_total, target.normals, target.corner_vert, target.corner_edge, target.vert_co)
+        core = np.flatnonzero(self.selected)
+        self.faces = self.arrays.halo(core, self.rings)
+        self.n_selected = len(core)
+        self.graph = self.arrays.subgraph(self.faces)
+        self.movable = np.arange(self.n_selected)
+        self.fixed = np.arange(len(self.faces)) >= self.n_selected
+
+    def mask(self, local, context=False):
+        # Flip mask over the whole mesh from one over the region, without the context faces unless asked
+        n = len(self.faces) if context else self.n_selected
+        mask = np.zeros(self.arrays.n_faces, dtype=bool)
+        mask[self.faces[:n]] = local[:n]
+        return mask
+
+    def finish(self, local, result, context=False):
+        # What the method steps return: the graph to write through, the flip mask and the summary
+        summary = {'faces': self.n_selected, 'context': len(self.faces) - self.n_selected, **result}
+        return self.target, self.mask(local, context), summary
+
+    def orient_steps(self, pieces, score):
+        # Wind every piece of the region consistently: the pieces reaching the context from its faces as
+        # they are, the others (free) from their lowest scoring face. Returns the flip mask and which
+        # piece labels are free, for the method to turn those as a whole.
+        free = np.bincount(pieces, weights=self.fixed, minlength=self.graph.n_faces) == 0
+        loose = np.flatnonzero(free[pieces])
+        seeds = np.concatenate([np.flatnonzero(self.fixed), loose[island_seeds(pieces[loose], score[loose])]])
+        flip = yield from orient_steps(self.graph, seeds)
+        return flip, free
+
+    def bvh(self, reach):
+        # BVH tree over the region and every other face whose bounding box comes within reach of the
+        # region's, numbered after the region's own faces, so that rays from the region hit what they
+        # would in the whole mesh
+        arrays = self.arrays
+        with stats.phase('bvh'):
+            lo = np.full(3, np.inf)
+            hi = np.full(3, -np.inf)
+            if len(self.faces):
+                co = self.graph.vert_co[self.graph.corner_vert]
+                lo, hi = co.min(axis=0) - reach, co.max(axis=0) + reach
+            near = np.zeros(arrays.n_faces, dtype=bool)
+            if len(self.faces) and arrays.n_faces:
+                near[:] = True
+                # One axis at a time keeps the corner sized arrays small
+                for axis in range(3):
+                    co = arrays.vert_co[arrays.corner_vert, axis]
+                    near &= np.minimum.reduceat(co, arrays.loop_start) <= hi[axis]
+                    near &= np.maximum.reduceat(co, arrays.loop_start) >= lo[axis]
+            near[self.faces] = False
+            faces = np.concatenate([self.faces, np.flatnonzero(near)])
+            stats.count('bvh_faces', len(faces))
+            from mathutils.bvhtree import BVHTree
+            corners, owner, _ = index_ranges(arrays.loop_start[faces], arrays.loop_total[faces] - 2)
+            first = arrays.loop_start[faces][owner]
+            tris = arrays.corner_vert[np.stack([first, corners + 1, corners + 2], axis=1)]
+            verts, tris = np.unique(tris, return_inverse=True)
+            tree = BVHTree.FromPolygons(arrays.vert_co[verts].tolist(), tris.reshape(-1, 3).tolist(), all_triangles=True)
+            return tree, owner.astype(np.int32)
+
+    def caster(self, context, obj, distance, include_others=False):
+        # RayCaster for rays of up to distance (world units) from the region's faces
+        scale = np.linalg.svd(np.array(obj.matrix_world, dtype=np.float64)[:3, :3], compute_uv=False).min()
+        # Rays start a little off their faces
+        reach = distance / max(scale, 1e-12) + 0.01
+        return RayCaster(context, obj, lambda: self.bvh(reach), include_others)
+
+# Distances off the faces, in halves of a piece's radius, at which region pieces are tested; the
+# first (on the face) is the island vote of winding_flip_steps
+REGION_WINDING_SCALES = (0.0, 0.25, 0.5, 1.0)
+
+def region_winding_steps(tree, graph, region, accuracy=2.0, margin=0.2, max_passes=3):
+    # Winding Number Flip over a region: the pieces reaching its context are wound from it, the others
+    # are turned as a whole against the winding number tree of the whole mesh (graph). A piece is
+    # often only part of its island, so its own part P of the winding number comes from a tree over
+    # the region, whose islands are the pieces, and the rest R is the whole less P; turning the piece
+    # turns R + P into R - P. Right in front of a face the winding number should be 0 and behind it 1.
+    # On the face that is winding_flip_steps' island vote, which a flat piece leaves undecided (P is 0
+    # there), so each sampled face also votes at points further off it, and every piece goes by the
+    # nearest distance at which its vote favours one way by more than margin. As there, this repeats
+    # until nothing flips. Returns the flip mask, the number of free pieces and the passes.
+    piece_tree = WindingTree(region.graph)
+    pieces = piece_tree.islands
+    flip, free = yield from progress_range(region.orient_steps(pieces, np.arange(region.graph.n_faces)), 0.0, 0.1)
+    loose = np.flatnonzero(free[pieces])
+    loose = loose[np.argsort(pieces[loose], kind='stable')]
+    faces = spread_samples(loose, pieces[loose], 8, WINDING_SAMPLES)
+    n = region.graph.n_faces
+    k = len(REGION_WINDING_SCALES)
+    radius = np.sqrt(np.bincount(pieces, weights=region.graph.areas, minlength=n) / np.pi)[pieces[faces]]
+    target = region.faces[faces]
+    centers = region.graph.centers[faces]
+    area = region.graph.areas[faces]
+    piece_area = np.maximum(np.bincount(pieces[faces], weights=area, minlength=n), 1e-30)
+    wound = np.zeros(graph.n_faces, dtype=bool)
+    wound[region.faces] = flip
+    graph.flip(wound)
+    passes = 0
+    try:
+        vote = np.empty((k, len(faces)))
+        for passes in range(1, max_passes + 1):
+            piece_normals = np.where(flip[:, None], -region.graph.normals, region.graph.normals)
+            offset = piece_normals[faces] * (0.5 * radius)[:, None]
+            with stats.phase('winding'):
+                for start in range(0, len(faces), WINDING_CHUNK):
+                    part = slice(start, start + WINDING_CHUNK)
+                    m = len(centers[part])
+                    # On the face without its own triangles, then in front of and behind it at every distance
+                    points = np.concatenate([centers[part]] + [centers[part] + side * scale * offset[part]
+                                                               for scale in REGION_WINDING_SCALES[1:] for side in (1, -1)])
+                    skip = np.full(len(points), -1)
+                    skip[:m] = target[part]
+                    whole = tree.winding_numbers(points, graph.normals, accuracy, skip)
+                    skip[:m] = faces[part]
+                    labels = np.tile(pieces[faces[part]], 2 * k - 1)
+                    _, own = piece_tree.winding_numbers(points, piece_normals, accuracy, skip, labels)
+                    rest = whole - own
+                    vote[0, part] = np.abs(rest[:m] - own[:m] - 0.5) - np.abs(rest[:m] + own[:m] - 0.5)
+                    for j in range(1, k):
+                        front = slice((2 * j - 1) * m, 2 * j * m)
+                        back = slice(2 * j * m, (2 * j + 1) * m)
+                        # Half the miss from 0 in front and 1 behind, turned less as wound
+                        wound_miss = np.abs(whole[front]) + np.abs(whole[back] - 1)
+                        turned_miss = np.abs(rest[back] - own[back]) + np.abs(rest[front] - own[front] - 1)
+                        vote[j, part] = 0.5 * (turned_miss - wound_miss)
+                    done = min(start + WINDING_CHUNK, len(faces)) / len(faces)
+                    yield 0.1 + 0.9 * (passes - 1 + done) / max_passes
+            piece_vote = np.stack([np.bincount(pieces[faces], weights=area * np.clip(v, -1, 1), minlength=n)
+                                   for v in vote]) / piece_area
+            decided = np.abs(piece_vote) > margin
+            nearest = np.argmax(decided, axis=0)
+            mask = ((piece_vote[nearest, np.arange(n)] < -margin) & decided.any(axis=0))[pieces]
+            log(f'region winding pass {passes}: {np.count_nonzero(mask)} faces on the wrong side')
+            if not mask.any():
+                break
+            turned = np.zeros(graph.n_faces, dtype=bool)
+            turned[region.faces] = mask
+            graph.flip(turned)
+            wound ^= turned
+            flip ^= mask
+    finally:
+        graph.flip(wound)
+    return flip, int(np.count_nonzero(free[np.unique(pieces)])), passes
+
+# Method steps shared by the operators and the command line. Each is a generator over an Object Mode
+# mesh object: everything up to its first yield reads Blender data and has to run on the main thread,
+# the rest is NumPy and BVH work that may be time-sliced or moved to a worker thread (MeshSource and
+# Region are read in the first part and built in the second). It yields its progress from 0 to 1 and
+# returns the graph, the flip mask and a summary dict for write_result().
+
+# Rays cast per step by the ray casting methods
+RAY_CHUNK = 2048
+# Faces whose winding number is evaluated per step, and at most per island
+WINDING_CHUNK = 1024
+WINDING_SAMPLES = 64
+# Faces per patch whose rays decide the patch's orientation
+PATCH_SAMPLES = 8
+# Rings of halo faces around every Low Memory chunk of Persistent Flip: how far flips near a seam may
+# still follow from faces on the other side
+CHUNK_HALO = 4
+
+def advance(steps, budget=None):
+    # Run method steps for about budget seconds, or to the end without one.
+    # Returns (True, result) once they finished, else (False, progress).
+    deadline = None if budget is None else time.perf_counter() + budget
+    try:
+        while True:
+            progress = next(steps)
+            if deadline is not None and time.perf_counter() >= deadline:
+                return False, progress
+    except StopIteration as stop:
+        return True, stop.value
+
+def finish(steps):
+    return advance(steps)[1]
+
+def progress_range(steps, low, high):
+    # Steps with their progress mapped onto [low, high], for running them as part of longer steps
+    try:
+        while True:
+            try:
+                progress = next(steps)
+            except StopIteration as stop:
+                return stop.value
+            yield low + (high - low) * progress
+    finally:
+        steps.close()
+
+def write_result(obj, graph, mask, result):
+    flipped_count = flip_mesh_faces(obj.data, graph, mask)
+    result.setdefault('flipped', flipped_count)
+    return result
+
+@result_cached('neighbor')
+def neighbor_steps(context, obj, low_memory_mb=None, region_rings=None):
+    if region_rings is not None:
+        region = Region.from_mesh(obj.data, region_rings)
+        yield 0.0
+        region.build()
+        return region.finish(neighbor_flip_mask(region.graph, region.movable), {})
+    if low_memory_mb:
+        return (yield from chunked_steps(obj, low_memory_mb, 1, neighbor_chunk_steps))
+    source = MeshSource(obj.data)
+    yield 0.0
+    graph = source.graph()
+    return graph, neighbor_flip_mask(graph), {'faces': graph.n_faces}
+
+def neighbor_chunk_steps(graph):
+    mask = neighbor_flip_mask(graph)
+    yield 1.0
+    return mask, {}
+
+# Low Memory chunks follow the measured memory use, and Persistent Flip chain reactions may stop at their seams
+@result_cached('persistent', uncached=('low_memory_mb',))
+def persistent_steps(context, obj, max_passes=5, incremental=True, low_memory_mb=None, region_rings=None):
+    if region_rings is not None:
+        region = Region.from_mesh(obj.data, region_rings)
+        yield 0.0
+        region.build()
+        flipped, passes = yield from persistent_flip_steps(region.graph, max_passes, incremental, ~region.fixed)
+        return region.finish(flipped, {'passes': len(passes), 'checked': sum(checked for checked, num_flip in passes)})
+    if low_memory_mb:
+        def solve(graph):
+            flipped, passes = yield from persistent_flip_steps(graph, max_passes, incremental)
+            return flipped, {'passes': len(passes), 'checked': sum(checked for checked, num_flip in passes)}
+        return (yield from chunked_steps(obj, low_memory_mb, CHUNK_HALO, solve))
+    source = MeshSource(obj.data)
+    yield 0.0
+    graph = source.graph()
+    flipped, passes = yield from persistent_flip_steps(graph, max_passes, incremental)
+    return graph, flipped, {
+        'faces': graph.n_faces,
+        'flipped': int(np.count_nonzero(flipped)),
+        'passes': len(passes),
+        'checked': sum(checked for checked, num_flip in passes),
+    }
+
+@result_cached('manual_align', selection=True)
+def manual_align_steps(context, obj, low_memory_mb=None, region_rings=None):
+    selected = np.zeros(len(obj.data.polygons), dtype=bool)
+    obj.data.polygons.foreach_get('select', selected)
+    if region_rings is not None:
+        # The selected faces are the seeds here, so the rings around them are what gets aligned
+        region = Region.from_mesh(obj.data, region_rings)
+        yield 0.0
+        region.build()
+        _, first = np.unique(face_islands(region.graph)[region.movable], return_index=True)
+        mask = yield from orient_steps(region.graph, first)
+        return region.finish(mask, {'seeds': len(first)}, context=True)
+    if low_memory_mb:
+        def pick_seeds(chunks, islands):
+            seed_faces = np.flatnonzero(selected)
+            _, first = np.unique(islands[seed_faces], return_index=True)
+            return seed_faces[first]
+        return (yield from chunked_orient_steps(obj, low_memory_mb, pick_seeds))
+    source = MeshSource(obj.data)
+    yield 0.0
+    graph = source.graph()
+    # Propagate orientation from the first selected face of every island
+    seed_faces = np.flatnonzero(selected)
+    _, first = np.unique(face_islands(graph)[seed_faces], return_index=True)
+    mask = yield from orient_steps(graph, seed_faces[first])
+    return graph, mask, {'faces': graph.n_faces, 'seeds': len(first)}
+
+@result_cached('flood')
+def flood_steps(context, obj, voxels=True, resolution=128, memory_mb=256, low_memory_mb=None, region_rings=None):
+    if region_rings is not None:
+        region = Region.from_mesh(obj.data, region_rings, whole=voxels)
+        yield 0.0
+        region.build()
+        grid = None
+        if voxels:
+            grid = yield from progress_range(region.source.voxel_steps(resolution, memory_mb), 0.0, 0.8)
+        graph = region.graph
+        pieces = face_islands(graph)
+        mask, free = yield from progress_range(region.orient_steps(pieces, corner_distance(graph, pieces)),
+                                               0.8 if grid else 0.0, 1.0)
+        result = {'islands': len(np.unique(pieces))}
+        if grid is not None:
+            # As below, for the pieces that do not reach the context
+            score = np.where(mask, -1, 1) * grid.face_scores(region.target.normals)[region.faces] * graph.areas
+            vote = np.where(free, np.bincount(pieces, weights=score, minlength=graph.n_faces), 0)
+            mask ^= (vote < 0)[pieces]
+            result['voxel_islands'] = int(np.count_nonzero(vote))
+            result['cells'] = grid.cells
+        return region.finish(mask, result)
+    if low_memory_mb and not voxels:
+        return (yield from chunked_orient_steps(obj, low_memory_mb, corner_seeds))
+    source = MeshSource(obj.data)
+    yield 0.0
+    graph = source.graph()
+    grid = None
+    if voxels:
+        grid = yield from progress_range(source.voxel_steps(resolution, memory_mb), 0.0, 0.8)
+    islands = face_islands(graph)
+    # Seed every island with the face closest to its bounding box min corner, a point outside the mesh
+    seeds = island_seeds(islands, corner_distance(graph, islands))
+    mask = yield from progress_range(orient_steps(graph, seeds), 0.8 if grid else 0.0, 1.0)
+    result = {'faces': graph.n_faces, 'islands': len(seeds)}
+    if grid is not None:
+        # Turn around the islands whose faces, as propagated, mostly face the enclosed side;
+        # islands the grid says nothing about keep the seed's orientation
+        score = np.where(mask, -1, 1) * grid.face_scores(graph.normals) * graph.areas
+        vote = np.bincount(islands, weights=score, minlength=graph.n_faces)
+        mask ^= (vote < 0)[islands]
+        result['voxel_islands'] = int(np.count_nonzero(vote))
+        result['cells'] = grid.cells
+    return graph, mask, result
+
+@result_cached('exhe', transform=True)
+def exhe_steps(context, obj, include_others=False, voxels=False, resolution=128, memory_mb=256, region_rings=None):
+    n_edges = len(obj.data.edges)
+    if region_rings is not None:
+        # The voxel grid covers the whole mesh; rays only need the faces around the region
+        region = Region.from_mesh(obj.data, region_rings, whole=voxels)
+        source = region.source
+        caster = None if voxels else region.caster(context, obj, 0.5, include_others)
+    else:
+        region = None
+        source = MeshSource(obj.data, triangles=not voxels)
+        caster = None if voxels else RayCaster(context, obj, source.bvh, include_others)
+    yield 0.0
+    if region is not None:
+        region.build()
+        whole, graph = region.arrays, region.graph
+    else:
+        whole = graph = source.graph()
+    # Find boundary faces (faces with at least one boundary edge)
+    edge_users = np.bincount(whole.corner_edge, minlength=n_edges)
+    boundary_faces = np.unique(graph.corner_face[edge_users[graph.corner_edge] == 1])
+    if region is not None:
+        boundary_faces = boundary_faces[boundary_faces < region.n_selected]
+    if voxels:
+        grid = yield from source.voxel_steps(resolution, memory_mb)
+        # Flip boundary faces whose back is open space and whose front is enclosed
+        mask = np.zeros(graph.n_faces, dtype=bool)
+        scores = grid.face_scores(grid.graph.normals)
+        mask[boundary_faces] = scores[boundary_faces if region is None else region.faces[boundary_faces]] < 0
+        if region is not None:
+            return region.finish(mask, {'cells': grid.cells})
+        return graph, mask, {'faces': graph.n_faces, 'cells': grid.cells}
+    # Cast a ray from just outside each face along the normal, and one from just inside against it.
+    # Open in front: exposed, keep. Otherwise open behind: interior (room) face pointing into the wall, flip
+    mask = np.zeros(graph.n_faces, dtype=bool)
+    for start in range(0, len(boundary_faces), RAY_CHUNK):
+        faces = boundary_faces[start:start + RAY_CHUNK]
+        centers = graph.centers[faces]
+        normals = graph.normals[faces]
+        front, _ = caster.cast(centers + normals * 0.001, normals, 0.5, faces)
+        back, _ = caster.cast(centers - normals * 0.001, -normals, 0.5, faces)
+        mask[faces] = np.isfinite(front) & np.isinf(back)
+        yield (start + len(faces)) / len(boundary_faces)
+    if region is not None:
+        return region.finish(mask, {'rays': 2 * len(boundary_faces)})
+    return graph, mask, {'faces': graph.n_faces, 'rays': 2 * len(boundary_faces)}
+
+@result_cached('ao', transform=True)
+def ao_steps(context, obj, samples=16, distance=0.5, margin=0.2, include_others=False, region_rings=None):
+    if region_rings is not None:
+        region = Region.from_mesh(obj.data, region_rings)
+        caster = region.caster(context, obj, distance, include_others)
+        yield 0.0
+        region.build()
+        mask, rays = yield from ao_flip_steps(caster, region.graph, samples, distance, margin, faces=region.movable)
+        return region.finish(mask, {'rays': rays})
+    source = MeshSource(obj.data, triangles=True)
+    caster = RayCaster(context, obj, source.bvh, include_others)
+    yield 0.0
+    graph = source.graph()
+    mask, rays = yield from ao_flip_steps(caster, graph, samples, distance, margin)
+    return graph, mask, {'faces': graph.n_faces, 'rays': rays}
+
+@result_cached('patch', transform=True)
+def patch_steps(context, obj, samples=8, distance=0.5, sharp_angle=np.radians(60), smoothness=1.0, include_others=False,
+                region_rings=None):
+    if region_rings is not None:
+        region = Region.from_mesh(obj.data, region_rings)
+        caster = region.caster(context, obj, distance, include_others)
+        yield 0.0
+        region.build()
+        mask, patches, rays = yield from patch_flip_steps(caster, region.graph, samples, distance, sharp_angle, smoothness,
+                                                          region.fixed)
+        return region.finish(mask, {'patches': patches, 'rays': rays})
+    source = MeshSource(obj.data, triangles=True)
+    caster = RayCaster(context, obj, source.bvh, include_others)
+    yield 0.0
+    graph = source.graph()
+    mask, patches, rays = yield from patch_flip_steps(caster, graph, samples, distance, sharp_angle, smoothness)
+    return graph, mask, {'faces': graph.n_faces, 'patches': patches, 'rays': rays}
+
+@result_cached('winding')
+def winding_steps(context, obj, accuracy=2.0, margin=0.2, region_rings=None):
+    if region_rings is not None:
+        region = Region.from_mesh(obj.data, region_rings, whole=True)
+        yield 0.0
+        region.build()
+        tree = region.source.winding()
+        mask, pieces, passes = yield from region_winding_steps(tree, region.target, region, accuracy, margin)
+        return region.finish(mask, {'islands': pieces, 'passes': passes})
+    source = MeshSource(obj.data)
+    yield 0.0
+    graph = source.graph()
+    tree = source.winding()
+    mask, islands, passes = yield from winding_flip_steps(tree, graph, accuracy, margin)
+    return graph, mask, {'faces': graph.n_faces, 'islands': islands, 'passes': passes}
+
+def recalc_outside(context, obj, select_all=True):
+    # Without select_all only the selected faces are recalculated
+    context.view_layer.objects.active = obj
+    mode_set('EDIT')
+    with stats.phase('recalc_outside'):
+        if select_all:
+            bpy.ops.mesh.select_all(action='SELECT')
+        bpy.ops.mesh.normals_make_consistent(inside=False)
+    mode_set('OBJECT')
+
+# Method entry points for scripts and the command line: run the steps straight through and write the flips
+
+def run_steps(obj, steps):
+    return write_result(obj, *finish(steps))
+
+def run_neighbor(context, obj, low_memory_mb=None, region_rings=None):
+    return run_steps(obj, neighbor_steps(context, obj, low_memory_mb, region_rings))
+
+def run_persistent(context, obj, max_passes=5, incremental=True, low_memory_mb=None, region_rings=None):
+    return run_steps(obj, persistent_steps(context, obj, max_passes, incremental, low_memory_mb, region_rings))
+
+def run_hybrid(context, obj, max_passes=5, incremental=True, low_memory_mb=None, region_rings=None):
+    result = run_persistent(context, obj, max_passes, incremental, low_memory_mb, region_rings)
+    # Now recalculate outside
+    recalc_outside(context, obj, region_rings is None)
+    return result
+
+def run_manual_align(context, obj, low_memory_mb=None, region_rings=None):
+    return run_steps(obj, manual_align_steps(context, obj, low_memory_mb, region_rings))
+
+def run_flood(context, obj, voxels=True, resolution=128, memory_mb=256, low_memory_mb=None, region_rings=None):
+    return run_steps(obj, flood_steps(context, obj, voxels, resolution, memory_mb, low_memory_mb, region_rings))
+
+def run_exhe(context, obj, include_others=False, voxels=False, resolution=128, memory_mb=256, region_rings=None):
+    return run_steps(obj, exhe_steps(context, obj, include_others, voxels, resolution, memory_mb, region_rings))
+
+def run_ao(context, obj, samples=16, distance=0.5, margin=0.2, include_others=False, region_rings=None):
+    return run_steps(obj, ao_steps(context, obj, samples, distance, margin, include_others, region_rings))
+
+def run_winding(context, obj, accuracy=2.0, margin=0.2, region_rings=None):
+    return run_steps(obj, winding_steps(context, obj, accuracy, margin, region_rings))
+
+def run_patch(context, obj, samples=8, distance=0.5, sharp_angle=np.radians(60), smoothness=1.0, include_others=False,
+              region_rings=None):
+    return run_steps(obj, patch_steps(context, obj, samples, distance, sharp_angle, smoothness, include_others, region_rings))
+
+METHODS = {
+    'neighbor': run_neighbor,
+    'persistent': run_persistent,
+    'flood': run_flood,
+    'exhe': run_exhe,
+    'ao': run_ao,
+    'winding': run_winding,
+    'patch': run_patch,
+    'hybrid': run_hybrid,
+}
+
 class flippen_preferences(bpy.types.AddonPreferences):
     bl_idname = __name__
     pref_log: bpy.props.BoolProperty(
         name='Logging',
         description='Logging to the console',
-        default=False)
+        default=False,
+        update=update_log)
     pref_def: EnumProperty(
         items=[('0', 'Flip Normals', 'Flip Normals'),
                ('1', 'Make Normals Consistent', 'Make Normals Consistent'),
@@ -30,54 +2347,285 @@ class flippen_preferences(bpy.types.AddonPreferences):
         name='Default behavior (after Blender reload)',
         description='Default behavior',
         default='0')
+    pref_cache_mb: bpy.props.IntProperty(
+        name='Analysis Cache (MB)',
+        description='Memory for mesh adjacency and ray casting data kept between runs (0 disables the cache)',
+        default=512, min=0, soft_max=8192,
+        update=update_cache_mb)
+    pref_result_cache: bpy.props.BoolProperty(
+        name='Result Cache',
+        description='Keep the flips of every run on disk and reuse them when the same mesh is flipped the same way again',
+        default=False)
+    pref_result_cache_dir: bpy.props.StringProperty(
+        name='Directory',
+        description='Where the result cache keeps its files (empty for a flippen_results folder in the Blender user data)',
+        subtype='DIR_PATH',
+        default='')
+    pref_result_cache_mb: bpy.props.IntProperty(
+        name='Size Limit (MB)',
+        description='Disk space for the result cache; the least recently used results are removed beyond it',
+        default=ResultCache.LIMIT_MB, min=1, soft_max=16384)
     def draw(self, context):
         self.layout.prop(self, 'pref_def')
         self.layout.prop(self, 'pref_log')
+        self.layout.prop(self, 'pref_cache_mb')
+        box = self.layout.box()
+        box.prop(self, 'pref_result_cache')
+        col = box.column()
+        col.enabled = self.pref_result_cache
+        col.prop(self, 'pref_result_cache_dir')
+        col.prop(self, 'pref_result_cache_mb')
+        row = col.row()
+        row.label(text=f'{result_cache.hits} hits, {result_cache.misses} misses this session')
+        row.operator(FLIPPEN_OT_result_cache_clear.bl_idname)
         self.layout.label(text="Report bugs or get help:")
         self.layout.operator("wm.url_open", text="flippen on GitHub").url = "https://github.com/tankshield/flippen"
 
-class FLIPPEN_OT_persistent(bpy.types.Operator):
-    bl_idname = 'object.flippen_persistent'
-    bl_label = 'Persistent Flip'
-    def execute(self, context):
-        max_passes = context.window_manager.flippen_max_passes
+def total(results, key):
+    return sum(result[key] for obj, result in results)
+
+def low_memory_budget(context):
+    # The Low Memory budget in MB, or None when the option is off
+    wm = context.window_manager
+    return wm.flippen_memory_mb if wm.flippen_low_memory else None
+
+def region_rings(context):
+    # Context rings around the selection for the Scope option, or None for the whole mesh
+    wm = context.window_manager
+    return {'WHOLE': None, 'SELECTED': 0}.get(wm.flippen_scope, wm.flippen_scope_rings)
+
+class FlipOperator:
+    # Shared body of the flip operators: a subclass gives the method steps for one object and
+    # reports the results. execute() runs the steps straight through. With Non-Blocking on, invoke()
+    # runs them from a timer for one time slice per tick (or on a worker thread) with progress in the
+    # status bar, and only writes the flips once every object has finished, so Esc leaves the meshes
+    # as they were.
+    restore_mode = False    # Return to Edit Mode afterwards when the run started there
+    running = None          # Label of the non-blocking run in progress
+
+    @classmethod
+    def poll(cls, context):
+        # One non-blocking run at a time: it holds the cached analysis of its meshes until it ends
+        return FlipOperator.running is None
+
+    def objects(self, context):
         obj = context.active_object
-        if not obj or obj.type != 'MESH':
+        return [obj] if obj and obj.type == 'MESH' else []
+
+    def after(self, context, obj, result):
+        return result
+
+    def report_result(self, results):
+        self.report({'INFO'}, f"{self.bl_label}: {total(results, 'flipped')} faces flipped")
+        return {'FINISHED'}
+
+    def report_scope(self, results):
+        # Region runs (the Scope option) say how much of the mesh they worked on
+        scoped = [(obj, result) for obj, result in results if 'context' in result]
+        for obj, result in scoped:
+            log(f"{obj.name} - {result['faces']} selected faces with {result['context']} context faces")
+        if scoped and not total(scoped, 'faces'):
+            self.report({'WARNING'}, 'Scope: no faces selected, nothing to do')
+
+    def report_cache(self, results):
+        # Runs through the result cache say how many objects reused stored flips
+        hits = sum(result.get('cache_hits', 0) for obj, result in results)
+        if hits:
+            self.report({'INFO'}, f'Result Cache: {hits} of {len(results)} objects reused stored flips')
+
+    def low_memory_note(self, context):
+        # Why a run with Low Memory on analysed its meshes in one go
+        if region_rings(context) is not None:
+            return 'Scope runs analyse the selection in one go'
+        return f'{self.bl_label} has no Low Memory mode'
+
+    def report_memory(self, context, results):
+        # Low Memory runs report their peak after the method's own report, and warn when the method
+        # or its settings analysed meshes in one go instead (stored flips reused from the result cache
+        # take no analysis)
+        wm = context.window_manager
+        whole = [obj for obj, result in results if 'peak_mb' not in result and not result.get('cache_hits')]
+        if wm.flippen_low_memory and whole:
+            self.report({'WARNING'}, f'Low Memory: {self.low_memory_note(context)}, '
+                                     f'{len(whole)} of {len(results)} objects analysed whole')
+        chunked = [(obj, result) for obj, result in results if 'peak_mb' in result]
+        if not chunked:
+            return
+        for obj, result in chunked:
+            log(f"{obj.name} - peak {result['peak_mb']} MB in {result['chunks']} chunks")
+        budget = wm.flippen_memory_mb
+        peak = max(result['peak_mb'] for obj, result in chunked)
+        level = 'WARNING' if peak > budget else 'INFO'
+        self.report({level}, f"Low Memory: peak {peak} MB of {budget} MB in {total(chunked, 'chunks')} chunks")
+
+    @profiled()
+    def execute(self, context):
+        objects = self.objects(context)
+        if not objects:
             self.report({'WARNING'}, 'No active mesh object')
             return {'CANCELLED'}
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.reveal()
-        bpy.ops.mesh.select_all(action='DESELECT')
-        import bmesh
-        bm = bmesh.from_edit_mesh(obj.data)
-        bm.faces.ensure_lookup_table()
-        total_flipped = 0
-        for pass_num in range(max_passes):
-            faces_to_flip = []
-            for f in bm.faces:
-                neighbor_normals = []
-                for loop in f.loops:
-                    edge = loop.edge
-                    for linked_face in edge.link_faces:
-                        if linked_face != f:
-                            neighbor_normals.append(linked_face.normal.normalized())
-                if not neighbor_normals:
-                    continue
-                dot_products = [f.normal.normalized().dot(n) for n in neighbor_normals]
-                num_opposite = sum(1 for d in dot_products if d < 0)
-                if num_opposite > len(neighbor_normals) / 2:
-                    faces_to_flip.append(f)
-            if not faces_to_flip:
-                break
-            for f in bm.faces:
-                f.select = False
-            for f in faces_to_flip:
-                f.select = True
-            bmesh.update_edit_mesh(obj.data, loop_triangles=False, destructive=False)
-            bpy.ops.mesh.flip_normals()
-            total_flipped += len(faces_to_flip)
-        bpy.ops.object.mode_set(mode='OBJECT')
-        self.report({'INFO'}, f'Persistent Flip: {total_flipped} faces flipped in up to {max_passes} passes')
+        mode = context.mode
+        if mode != 'OBJECT':
+            mode_set('OBJECT')
+        results = []
+        for obj in objects:
+            result = run_steps(obj, self.steps(context, obj))
+            results.append((obj, self.after(context, obj, result)))
+        if self.restore_mode and mode == 'EDIT_MESH':
+            mode_set('EDIT')
+        status = self.report_result(results)
+        self.report_scope(results)
+        self.report_cache(results)
+        self.report_memory(context, results)
+        return status
+
+    def invoke(self, context, event):
+        wm = context.window_manager
+        if not wm.flippen_modal:
+            return self.execute(context)
+        objects = self.objects(context)
+        if not objects:
+            self.report({'WARNING'}, 'No active mesh object')
+            return {'CANCELLED'}
+        self._mode = context.mode
+        if self._mode != 'OBJECT':
+            mode_set('OBJECT')
+        self._queue = [obj.name for obj in objects]
+        self._jobs = []
+        self._steps = self._worker = None
+        self._done_faces = 0
+        self._budget = wm.flippen_budget_ms / 1000
+        self._threaded = wm.flippen_thread
+        self._profile = contextlib.ExitStack()
+        obj = context.active_object
+        self._profile.enter_context(stats.run(self.bl_label, wm.flippen_stats, object=obj.name if obj else None))
+        self._start = time.perf_counter()
+        FlipOperator.running = self.bl_label
+        wm.progress_begin(0, 100)
+        self._timer = wm.event_timer_add(0.001, window=context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC' and event.value == 'PRESS':
+            self.cancel(context)
+            self.report({'INFO'}, f'{self.bl_label} cancelled, nothing changed')
+            return {'CANCELLED'}
+        if event.type != 'TIMER' or event.timer != self._timer:
+            return {'PASS_THROUGH'}
+        try:
+            if self._steps is None:
+                if not self._queue:
+                    return self._write(context)
+                done, progress = self._start_object(context)
+            elif self._worker is not None:
+                done = not self._worker.is_alive()
+                if done and self._worker.error is not None:
+                    raise self._worker.error
+                progress = self._worker.result if done else self._worker.progress
+            else:
+                done, progress = advance(self._steps, self._budget)
+            if done:
+                self._jobs.append((self._name, progress))
+                self._done_faces += self._faces
+                self._steps = self._worker = None
+                progress = 0.0
+        except Exception:
+            self.cancel(context)
+            raise
+        self._show_progress(context, progress)
+        return {'RUNNING_MODAL'}
+
+    def cancel(self, context):
+        if self._worker is not None:
+            self._worker.cancelled.set()
+            self._worker.join()
+        if self._steps is not None:
+            # Lets the steps restore anything they changed, such as Persistent Flip's graph
+            self._steps.close()
+        self._steps = self._worker = None
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+        self._profile.close()
+        FlipOperator.running = None
+        if self.restore_mode and self._mode == 'EDIT_MESH' and context.mode == 'OBJECT':
+            mode_set('EDIT')
+
+    def _start_object(self, context):
+        # The setup part of the steps, up to their first yield, always runs here on the main thread
+        self._name = self._queue.pop(0)
+        obj = bpy.data.objects[self._name]
+        self._faces = len(obj.data.polygons)
+        self._steps = self.steps(context, obj)
+        done, progress = advance(self._steps, 0)
+        if not done and self._threaded:
+            self._worker = StepWorker(self._steps)
+            self._worker.start()
+        return done, progress
+
+    def _write(self, context):
+        # Leave Edit Mode first so edits made during the run reach the mesh and are noticed below
+        if context.mode != 'OBJECT':
+            mode_set('OBJECT')
+        results = []
+        for name, (graph, mask, result) in self._jobs:
+            obj = bpy.data.objects.get(name)
+            if obj is None or obj.type != 'MESH' or not AnalysisCache.unchanged(obj.data, graph):
+                self.report({'WARNING'}, f'{name} changed during the run and was left as it is')
+                continue
+            result = write_result(obj, graph, mask, result)
+            results.append((obj, self.after(context, obj, result)))
+        self.cancel(context)
+        status = self.report_result(results)
+        self.report_scope(results)
+        self.report_cache(results)
+        self.report_memory(context, results)
+        return status
+
+    def _show_progress(self, context, progress):
+        count = len(self._jobs) + len(self._queue) + (self._steps is not None)
+        overall = (len(self._jobs) + progress) / count
+        rate = (self._done_faces + progress * self._faces) / max(time.perf_counter() - self._start, 1e-6)
+        context.window_manager.progress_update(int(100 * overall))
+        context.workspace.status_text_set(
+            f'{self.bl_label}: {100 * overall:.0f}% ({len(self._jobs)}/{count} objects), '
+            f'{rate:,.0f} faces/s - Esc to cancel')
+
+class StepWorker(threading.Thread):
+    # Runs method steps to the end off the main thread; setting cancelled stops it at the next step
+    def __init__(self, steps):
+        super().__init__(daemon=True)
+        self.steps = steps
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.cancelled = threading.Event()
+
+    def run(self):
+        try:
+            while not self.cancelled.is_set():
+                done, value = advance(self.steps, 0.05)
+                if done:
+                    self.result = value
+                    return
+                self.progress = value
+        except Exception as error:
+            self.error = error
+
+class FLIPPEN_OT_persistent(FlipOperator, bpy.types.Operator):
+    bl_idname = 'object.flippen_persistent'
+    bl_label = 'Persistent Flip'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def steps(self, context, obj):
+        wm = context.window_manager
+        return persistent_steps(context, obj, wm.flippen_max_passes, wm.flippen_incremental, low_memory_budget(context),
+                                region_rings(context))
+
+    def report_result(self, results):
+        self.report({'INFO'}, f"Persistent Flip: {total(results, 'flipped')} faces flipped in {total(results, 'passes')} passes ({total(results, 'checked')} face checks)")
         return {'FINISHED'}
 
 class FLIPPEN_OT_manual_align_start(bpy.types.Operator):
@@ -89,239 +2637,247 @@ class FLIPPEN_OT_manual_align_start(bpy.types.Operator):
         self.report({'INFO'}, 'Select a face in Edit Mode, then click Run Manual Align')
         return {'FINISHED'}
 
-class FLIPPEN_OT_manual_align_run(bpy.types.Operator):
+class FLIPPEN_OT_manual_align_run(FlipOperator, bpy.types.Operator):
     bl_idname = 'object.flippen_manual_align_run'
     bl_label = 'Run Manual Align'
     bl_description = 'Propagate correct orientation from the selected face to all connected faces'
+    bl_options = {'REGISTER', 'UNDO'}
+    restore_mode = True
 
-    def execute(self, context):
-        obj = context.active_object
-        if not obj or obj.type != 'MESH':
-            self.report({'WARNING'}, 'No active mesh object')
-            return {'CANCELLED'}
-        import bmesh
-        bm = bmesh.from_edit_mesh(obj.data)
-        bm.faces.ensure_lookup_table()
-        # Find the selected face
-        seed_faces = [f for f in bm.faces if f.select]
-        if not seed_faces:
+    def steps(self, context, obj):
+        return manual_align_steps(context, obj, low_memory_budget(context), region_rings(context))
+
+    def report_result(self, results):
+        if not total(results, 'seeds'):
             self.report({'WARNING'}, 'No face selected. Please select a face in Edit Mode (Face Select).')
             return {'CANCELLED'}
-        seed_face = seed_faces[0]
-        # Propagate orientation using BFS
-        from collections import deque
-        visited = set()
-        queue = deque()
-        queue.append((seed_face, seed_face.normal.copy()))
-        while queue:
-            face, ref_normal = queue.popleft()
-            if face.index in visited:
-                continue
-            visited.add(face.index)
-            # If the face normal is opposite to the reference, flip it
-            if face.normal.dot(ref_normal) < 0:
-                face.normal_flip()
-            # Add neighbors
-            for loop in face.loops:
-                edge = loop.edge
-                for linked_face in edge.link_faces:
-                    if linked_face.index not in visited:
-                        queue.append((linked_face, face.normal.copy()))
-        bmesh.update_edit_mesh(obj.data, loop_triangles=False, destructive=False)
-        self.report({'INFO'}, 'Manual align complete!')
+        self.report({'INFO'}, f"Manual align complete! {total(results, 'flipped')} faces flipped")
         return {'FINISHED'}
 
-class FLIPPEN_OT_exhe(bpy.types.Operator):
+class FLIPPEN_OT_exhe(FlipOperator, bpy.types.Operator):
     bl_idname = 'object.flippen_exhe'
     bl_label = 'Exterior Heuristic Flip'
     bl_description = 'Exterior Exposure Heuristic: Orient boundary faces based on exposure to empty space (works for rooms and exteriors)'
+    bl_options = {'REGISTER', 'UNDO'}
+    restore_mode = True
 
-    def execute(self, context):
-        obj = context.active_object
-        if not obj or obj.type != 'MESH':
-            self.report({'WARNING'}, 'No active mesh object')
-            return {'CANCELLED'}
-        if obj.mode != 'EDIT':
-            bpy.ops.object.mode_set(mode='EDIT')
-        import bmesh
-        from mathutils import Vector
-        bm = bmesh.from_edit_mesh(obj.data)
-        bm.faces.ensure_lookup_table()
-        bm.edges.ensure_lookup_table()
-        bm.verts.ensure_lookup_table()
-        # Find boundary faces (faces with at least one boundary edge)
-        boundary_faces = set()
-        for e in bm.edges:
-            if len(e.link_faces) == 1:
-                boundary_faces.add(e.link_faces[0])
-        # Use ray_cast to check exposure
-        depsgraph = context.evaluated_depsgraph_get()
-        obj_eval = obj.evaluated_get(depsgraph)
-        mesh_eval = obj_eval.to_mesh()
-        flipped_count = 0
-        for f in boundary_faces:
-            face_center = f.calc_center_median()
-            normal = f.normal.normalized()
-            # Cast a ray from just outside the face along the normal
-            ray_origin = obj.matrix_world @ (face_center + normal * 0.001)
-            ray_dir = obj.matrix_world.to_3x3() @ normal
-            hit, loc, norm, idx, obj_, mat = context.scene.ray_cast(
-                depsgraph, ray_origin, ray_dir, distance=0.5)
-            # Cast in the opposite direction as well
-            ray_origin_back = obj.matrix_world @ (face_center - normal * 0.001)
-            ray_dir_back = obj.matrix_world.to_3x3() @ (-normal)
-            hit_back, loc_back, norm_back, idx_back, obj_back, mat_back = context.scene.ray_cast(
-                depsgraph, ray_origin_back, ray_dir_back, distance=0.5)
-            # If the ray in the normal direction does NOT hit, it's exposed
-            if not hit:
-                # If the normal is pointing inward (into the mesh), flip it
-                if normal.dot(f.normal) < 0.0:
-                    f.normal_flip()
-                    flipped_count += 1
-            # If the ray in the opposite direction does NOT hit, it's interior (room)
-            elif not hit_back:
-                # If the normal is pointing outward (into the wall), flip it
-                if normal.dot(f.normal) > 0.0:
-                    f.normal_flip()
-                    flipped_count += 1
-        bmesh.update_edit_mesh(obj.data, loop_triangles=False, destructive=False)
-        obj_eval.to_mesh_clear()
-        self.report({'INFO'}, f'Exterior Heuristic Flip: {flipped_count} faces flipped')
-        return {'FINISHED'}
+    use_voxels: bpy.props.BoolProperty(
+        name='Voxel Grid',
+        description='Test exposure against a voxel flood fill from outside the bounding box instead of casting rays',
+        default=False)
+    resolution: bpy.props.IntProperty(
+        name='Resolution',
+        description='Voxels along the longest side of the bounding box',
+        default=128, min=8, soft_max=1024, max=4096)
+    memory: bpy.props.IntProperty(
+        name='Memory Cap (MB)',
+        description='Largest voxel grid to build; the resolution is lowered to stay under it',
+        default=256, min=16, soft_max=4096)
 
-class FLIPPEN_OT_flood_flip(bpy.types.Operator):
+    def steps(self, context, obj):
+        return exhe_steps(context, obj, context.window_manager.flippen_ray_others,
+                          self.use_voxels, self.resolution, self.memory, region_rings(context))
+
+class FLIPPEN_OT_flood_flip(FlipOperator, bpy.types.Operator):
     bl_idname = 'object.flippen_flood_flip'
     bl_label = 'Flood Flip'
     bl_description = 'Flood fill from outside: propagate correct orientation from outside the mesh'
+    bl_options = {'REGISTER', 'UNDO'}
+    restore_mode = True
 
-    def execute(self, context):
-        obj = context.active_object
-        if not obj or obj.type != 'MESH':
-            self.report({'WARNING'}, 'No active mesh object')
-            return {'CANCELLED'}
-        if obj.mode != 'EDIT':
-            bpy.ops.object.mode_set(mode='EDIT')
-        import bmesh
-        from mathutils import Vector
-        bm = bmesh.from_edit_mesh(obj.data)
-        bm.faces.ensure_lookup_table()
-        bm.edges.ensure_lookup_table()
-        bm.verts.ensure_lookup_table()
-        # Find a point outside the mesh (min bounding box corner)
-        min_corner = Vector((min(v.co.x for v in bm.verts), min(v.co.y for v in bm.verts), min(v.co.z for v in bm.verts)))
-        # Find the closest face to the min_corner
-        seed_face = min(bm.faces, key=lambda f: (f.calc_center_median() - min_corner).length)
-        # Flood fill from the seed face
-        from collections import deque
-        visited = set()
-        queue = deque()
-        queue.append((seed_face, seed_face.normal.copy()))
-        flipped_count = 0
-        while queue:
-            face, ref_normal = queue.popleft()
-            if face.index in visited:
-                continue
-            visited.add(face.index)
-            # If the face normal is opposite to the reference, flip it
-            if face.normal.dot(ref_normal) < 0:
-                face.normal_flip()
-                flipped_count += 1
-            # Add neighbors
-            for loop in face.loops:
-                edge = loop.edge
-                for linked_face in edge.link_faces:
-                    if linked_face.index not in visited:
-                        queue.append((linked_face, face.normal.copy()))
-        bmesh.update_edit_mesh(obj.data, loop_triangles=False, destructive=False)
-        self.report({'INFO'}, f'Flood Flip: {flipped_count} faces flipped')
+    use_voxels: bpy.props.BoolProperty(
+        name='Voxel Grid',
+        description="Orient every piece by a voxel flood fill from outside the bounding box instead of trusting the normal of its face nearest the bounding box corner",
+        default=True)
+    resolution: bpy.props.IntProperty(
+        name='Resolution',
+        description='Voxels along the longest side of the bounding box',
+        default=128, min=8, soft_max=1024, max=4096)
+    memory: bpy.props.IntProperty(
+        name='Memory Cap (MB)',
+        description='Largest voxel grid to build; the resolution is lowered to stay under it',
+        default=256, min=16, soft_max=4096)
+
+    def steps(self, context, obj):
+        return flood_steps(context, obj, self.use_voxels, self.resolution, self.memory, low_memory_budget(context),
+                           region_rings(context))
+
+    def low_memory_note(self, context):
+        if self.use_voxels and region_rings(context) is None:
+            return 'Flood Flip only works in chunks with Voxel Grid off'
+        return super().low_memory_note(context)
+
+    def report_result(self, results):
+        message = f"Flood Flip: {total(results, 'flipped')} faces flipped"
+        if self.use_voxels:
+            message += f" ({total(results, 'voxel_islands')} of {total(results, 'islands')} pieces placed by the voxel grid)"
+        self.report({'INFO'}, message)
         return {'FINISHED'}
 
-class FLIPPEN_OT_hybrid_flip(bpy.types.Operator):
+class FLIPPEN_OT_hybrid_flip(FlipOperator, bpy.types.Operator):
     bl_idname = 'object.flippen_hybrid_flip'
     bl_label = 'Hybrid Flip'
     bl_description = 'Persistent Flip followed by Recalculate Outside'
+    bl_options = {'REGISTER', 'UNDO'}
 
-    def execute(self, context):
-        max_passes = context.window_manager.flippen_max_passes
-        obj = context.active_object
-        if not obj or obj.type != 'MESH':
-            self.report({'WARNING'}, 'No active mesh object')
-            return {'CANCELLED'}
-        if obj.mode != 'EDIT':
-            bpy.ops.object.mode_set(mode='EDIT')
-        import bmesh
-        bm = bmesh.from_edit_mesh(obj.data)
-        bm.faces.ensure_lookup_table()
-        total_flipped = 0
-        for pass_num in range(max_passes):
-            faces_to_flip = []
-            for f in bm.faces:
-                neighbor_normals = []
-                for loop in f.loops:
-                    edge = loop.edge
-                    for linked_face in edge.link_faces:
-                        if linked_face != f:
-                            neighbor_normals.append(linked_face.normal.normalized())
-                if not neighbor_normals:
-                    continue
-                dot_products = [f.normal.normalized().dot(n) for n in neighbor_normals]
-                num_opposite = sum(1 for d in dot_products if d < 0)
-                if num_opposite > len(neighbor_normals) / 2:
-                    faces_to_flip.append(f)
-            if not faces_to_flip:
-                break
-            for f in bm.faces:
-                f.select = False
-            for f in faces_to_flip:
-                f.select = True
-            bmesh.update_edit_mesh(obj.data, loop_triangles=False, destructive=False)
-            bpy.ops.mesh.flip_normals()
-            total_flipped += len(faces_to_flip)
-        # Now recalculate outside
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.mesh.normals_make_consistent(inside=False)
-        bpy.ops.object.mode_set(mode='OBJECT')
-        self.report({'INFO'}, f'Hybrid Flip: {total_flipped} faces flipped, then recalculated outside')
+    def steps(self, context, obj):
+        wm = context.window_manager
+        return persistent_steps(context, obj, wm.flippen_max_passes, wm.flippen_incremental, low_memory_budget(context),
+                                region_rings(context))
+
+    def after(self, context, obj, result):
+        recalc_outside(context, obj, region_rings(context) is None)
+        return result
+
+    def report_result(self, results):
+        self.report({'INFO'}, f"Hybrid Flip: {total(results, 'flipped')} faces flipped, then recalculated outside")
         return {'FINISHED'}
 
-class FLIPPEN_OT_ao_flip(bpy.types.Operator):
+class FLIPPEN_OT_ao_flip(FlipOperator, bpy.types.Operator):
     bl_idname = 'object.flippen_ao_flip'
     bl_label = 'AO Flip'
-    bl_description = 'Flip faces with low ambient occlusion (likely inward)'
+    bl_description = 'Flip faces whose back side is clearly more open than their front (ambient occlusion on both hemispheres)'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    samples: bpy.props.IntProperty(
+        name='Samples',
+        description='Rays per hemisphere for every face',
+        default=16, min=1, max=256)
+    distance: bpy.props.FloatProperty(
+        name='Distance',
+        description='How far a ray may travel before the direction counts as open',
+        default=0.5, min=0.001, soft_max=10.0, subtype='DISTANCE')
+    margin: bpy.props.FloatProperty(
+        name='Margin',
+        description='Share of samples by which the back must be more open than the front to flip a face',
+        default=0.2, min=0.0, max=1.0, subtype='FACTOR')
+
+    def steps(self, context, obj):
+        return ao_steps(context, obj, self.samples, self.distance, self.margin,
+                        context.window_manager.flippen_ray_others, region_rings(context))
+
+    def report_result(self, results):
+        for obj, result in results:
+            log(f"{obj.name} - AO: {result['rays']} rays cast")
+        self.report({'INFO'}, f"AO Flip: {total(results, 'flipped')} faces flipped (back more open than front)")
+        return {'FINISHED'}
+
+class FLIPPEN_OT_winding_flip(FlipOperator, bpy.types.Operator):
+    bl_idname = 'object.flippen_winding_flip'
+    bl_label = 'Winding Number Flip'
+    bl_description = 'Flip whole connected pieces whose front side is inside the mesh by its generalized winding number (works on open and imperfect meshes)'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    accuracy: bpy.props.FloatProperty(
+        name='Accuracy',
+        description='Groups of faces farther away than this many times their size are approximated as one; higher is slower and more exact',
+        default=2.0, min=1.0, soft_max=8.0)
+    margin: bpy.props.FloatProperty(
+        name='Margin',
+        description='How clearly a piece must face inward before it is flipped',
+        default=0.2, min=0.0, max=1.0, subtype='FACTOR')
+
+    def steps(self, context, obj):
+        return winding_steps(context, obj, self.accuracy, self.margin, region_rings(context))
+
+    def report_result(self, results):
+        self.report({'INFO'}, f"Winding Number Flip: {total(results, 'flipped')} faces flipped in {total(results, 'islands')} pieces")
+        return {'FINISHED'}
+
+class FLIPPEN_OT_patch_flip(FlipOperator, bpy.types.Operator):
+    bl_idname = 'object.flippen_patch_flip'
+    bl_label = 'Patch Flip'
+    bl_description = 'Group faces into consistently wound patches, cast rays from a few faces of each, and choose the flips of all patches together'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    samples: bpy.props.IntProperty(
+        name='Samples',
+        description='Rays per hemisphere for every sampled face',
+        default=8, min=1, max=256)
+    distance: bpy.props.FloatProperty(
+        name='Distance',
+        description='How far a ray may travel before the direction counts as open',
+        default=0.5, min=0.001, soft_max=10.0, subtype='DISTANCE')
+    sharp_angle: bpy.props.FloatProperty(
+        name='Sharp Angle',
+        description='Patches also end at edges where the surface turns by more than this',
+        default=np.radians(60), min=0.0, max=np.pi, subtype='ANGLE')
+    smoothness: bpy.props.FloatProperty(
+        name='Smoothness',
+        description='How strongly neighbouring patches are kept wound alike against the rays',
+        default=1.0, min=0.0, soft_max=10.0)
+
+    def steps(self, context, obj):
+        return patch_steps(context, obj, self.samples, self.distance, self.sharp_angle, self.smoothness,
+                           context.window_manager.flippen_ray_others, region_rings(context))
+
+    def report_result(self, results):
+        for obj, result in results:
+            log(f"{obj.name} - Patch: {result['patches']} patches, {result['rays']} rays cast")
+        self.report({'INFO'}, f"Patch Flip: {total(results, 'flipped')} faces flipped in {total(results, 'patches')} patches")
+        return {'FINISHED'}
+
+class FLIPPEN_OT_stats_save(bpy.types.Operator):
+    bl_idname = 'object.flippen_stats_save'
+    bl_label = 'Save Run Stats'
+    bl_description = 'Write the last profiled run to a JSON file'
+    filepath: bpy.props.StringProperty(subtype='FILE_PATH', default='flippen_stats.json')
+    filter_glob: bpy.props.StringProperty(default='*.json', options={'HIDDEN'})
+
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
 
     def execute(self, context):
-        obj = context.active_object
-        if not obj or obj.type != 'MESH':
-            self.report({'WARNING'}, 'No active mesh object')
+        import json
+        if stats.last is None:
+            self.report({'WARNING'}, 'No profiled run yet')
             return {'CANCELLED'}
-        if obj.mode != 'EDIT':
-            bpy.ops.object.mode_set(mode='EDIT')
-        import bmesh
-        bm = bmesh.from_edit_mesh(obj.data)
-        bm.faces.ensure_lookup_table()
-        # Use AO: For each face, sample AO by casting rays from the face center along the normal
-        from mathutils import Vector
-        depsgraph = context.evaluated_depsgraph_get()
-        obj_eval = obj.evaluated_get(depsgraph)
-        threshold = 0.1  # AO threshold (tweak as needed)
-        flipped_count = 0
-        for f in bm.faces:
-            face_center = f.calc_center_median()
-            normal = f.normal.normalized()
-            ray_origin = obj.matrix_world @ (face_center + normal * 0.001)
-            ray_dir = obj.matrix_world.to_3x3() @ normal
-            hit, loc, norm, idx, obj_, mat = context.scene.ray_cast(
-                depsgraph, ray_origin, ray_dir, distance=0.5)
-            if hit:
-                # If the ray hits something very close, it's likely occluded (inward)
-                if (loc - ray_origin).length < threshold:
-                    f.normal_flip()
-                    flipped_count += 1
-        bmesh.update_edit_mesh(obj.data, loop_triangles=False, destructive=False)
-        bpy.ops.object.mode_set(mode='OBJECT')
-        self.report({'INFO'}, f'AO Flip: {flipped_count} faces flipped (low AO)')
+        with open(bpy.path.abspath(self.filepath), 'w') as f:
+            json.dump(stats.last, f, indent=2)
+        self.report({'INFO'}, f'Run stats saved to {self.filepath}')
         return {'FINISHED'}
 
+class FLIPPEN_OT_result_cache_clear(bpy.types.Operator):
+    bl_idname = 'object.flippen_result_cache_clear'
+    bl_label = 'Clear Result Cache'
+    bl_description = 'Remove every stored result and reset the hit and miss counts'
+
+    def execute(self, context):
+        result_cache.clear()
+        self.report({'INFO'}, 'Result cache cleared')
+        return {'FINISHED'}
+
+class FLIPPEN_PT_stats(bpy.types.Panel):
+    bl_label = 'Run Stats'
+    bl_idname = 'FLIPPEN_PT_stats'
+    bl_space_type = 'VIEW_3D'
+    bl_region_type = 'UI'
+    bl_category = 'flippen'
+    bl_parent_id = 'FLIPPEN_PT_panel'
+    bl_options = {'DEFAULT_CLOSED'}
+
+    def draw(self, context):
+        layout = self.layout
+        layout.prop(context.window_manager, 'flippen_stats')
+        last = stats.last
+        if last is None:
+            layout.label(text='No profiled run yet')
+            return
+        title = last['run'] + (f" ({last['object']})" if last.get('object') else '')
+        layout.label(text=f"{title}: {last['seconds'] * 1000:.1f} ms")
+        col = layout.column(align=True)
+        for name, phase in sorted(last['phases'].items(), key=lambda item: -item[1]['seconds']):
+            row = col.row()
+            row.label(text=name)
+            row.label(text=f"{phase['seconds'] * 1000:.1f} ms x{phase['calls']}")
+        col = layout.column(align=True)
+        for name, value in sorted(last['counters'].items()):
+            row = col.row()
+            row.label(text=name)
+            row.label(text=str(value))
+        layout.operator('object.flippen_stats_save', icon='FILE_TICK')
+
 class FLIPPEN_PT_panel(bpy.types.Panel):
     bl_label = 'flippen Tools'
     bl_idname = 'FLIPPEN_PT_panel'
@@ -331,17 +2887,46 @@ class FLIPPEN_PT_panel(bpy.types.Panel):
 
     def draw(self, context):
         layout = self.layout
+        if FlipOperator.running:
+            layout.label(text=f'{FlipOperator.running} running, Esc to cancel', icon='TIME')
+        layout.prop(context.window_manager, 'flippen_scope')
+        row = layout.row()
+        row.active = context.window_manager.flippen_scope == 'CONTEXT'
+        row.prop(context.window_manager, 'flippen_scope_rings')
         layout.prop(context.window_manager, 'flippen_param')
         layout.operator('object.flippen', text='Flip', icon='MODIFIER')
-        layout.prop(context.window_manager, 'flippen_max_passes')
+        layout.prop(context.window_manager, 'flippen_incremental')
+        row = layout.row()
+        row.active = not context.window_manager.flippen_incremental
+        row.prop(context.window_manager, 'flippen_max_passes')
         layout.operator('object.flippen_persistent', text='Persistent Flip', icon='LOOP_FORWARDS')
         layout.separator()
         layout.label(text='Hybrid:')
         layout.operator('object.flippen_hybrid_flip', text='Hybrid Flip', icon='MODIFIER')
         layout.separator()
+        layout.label(text='Execution:')
+        layout.prop(context.window_manager, 'flippen_modal')
+        col = layout.column()
+        col.active = context.window_manager.flippen_modal
+        col.prop(context.window_manager, 'flippen_budget_ms')
+        col.prop(context.window_manager, 'flippen_thread')
+        layout.prop(context.window_manager, 'flippen_low_memory')
+        row = layout.row()
+        row.active = context.window_manager.flippen_low_memory
+        row.prop(context.window_manager, 'flippen_memory_mb')
+        layout.separator()
+        layout.label(text='Ray Casting:')
+        layout.prop(context.window_manager, 'flippen_ray_others')
+        layout.separator()
         layout.label(text='AO Analysis:')
         layout.operator('object.flippen_ao_flip', text='AO Flip', icon='SHADING_RENDERED')
         layout.separator()
+        layout.label(text='Winding Number:')
+        layout.operator('object.flippen_winding_flip', text='Winding Number Flip', icon='ORIENTATION_NORMAL')
+        layout.separator()
+        layout.label(text='Patch Solver:')
+        layout.operator('object.flippen_patch_flip', text='Patch Flip', icon='MOD_EXPLODE')
+        layout.separator()
         layout.label(text='Exterior Heuristic:')
         layout.operator('object.flippen_exhe', text='Exterior Heuristic Flip', icon='SNAP_FACE')
         layout.separator()
@@ -354,65 +2939,77 @@ class FLIPPEN_PT_panel(bpy.types.Panel):
         layout.label(text='2. Select an outside face')
         layout.label(text='3. Click Run Manual Align')
 
-class flippen(bpy.types.Operator):
+class flippen(FlipOperator, bpy.types.Operator):
     bl_idname = 'object.flippen'
     bl_label = 'flippen'
     bl_context = 'objectmode'
     bl_options = {'REGISTER', 'UNDO'}
+
+    def objects(self, context):
+        # Linked duplicates share one mesh, which must only be processed once
+        meshes = {}
+        for obj in context.selected_objects:
+            if obj.type != 'MESH':
+                log(obj.name + ' is not a mesh object')
+            elif obj.data.as_pointer() in meshes:
+                log(obj.name + ' shares its mesh with ' + meshes[obj.data.as_pointer()].name + ', skipped')
+            else:
+                meshes[obj.data.as_pointer()] = obj
+        return list(meshes.values())
+
+    def steps(self, context, obj):
+        return neighbor_steps(context, obj, low_memory_budget(context), region_rings(context))
+
+    def report_result(self, results):
+        for obj, result in results:
+            log(obj.name + f" - operation complete! {result['flipped']} faces flipped")
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        # Only Flip Normals can run non-blocking; the other modes are single Blender operators
+        if context.window_manager.flippen_param != '0':
+            return self.execute(context)
+        return super().invoke(context, event)
+
+    @profiled('Flip')
     def execute(self, context):
         param = context.window_manager.flippen_param
-        objects = context.selected_objects
-        if len(objects) == 0:
+        if len(context.selected_objects) == 0:
             log('no selected objects')
             return {'FINISHED'}
+        if context.mode != 'OBJECT':
+            mode_set('OBJECT')
         wm = context.window_manager
-        wm.progress_begin(0, len(objects))
+        if param == '0' and (wm.flippen_low_memory or region_rings(context) is not None or result_cache.settings()[0]):
+            # One mesh at a time, in chunks, just its selection or through the result cache, rather than all
+            # of them whole and in parallel
+            return super().execute(context)
+        meshes = self.objects(context)
+        wm.progress_begin(0, len(meshes))
         progress = 0
-        for obj in objects:
-            if obj.type != 'MESH':
-                log(obj.name + ' is not a mesh object')
-            else:
+        if param == '0':
+            # Neighbor Consistency Check: Flip only faces whose normal is opposite to the majority of their neighbors
+            for obj, flipped_count in neighbor_flip_objects(meshes):
+                log(obj.name + f' - operation complete! {flipped_count} faces flipped')
+                progress += 1
+                wm.progress_update(progress)
+        else:
+            if wm.flippen_low_memory:
+                self.report({'WARNING'}, 'Low Memory: Make Normals Consistent has no Low Memory mode')
+            for obj in meshes:
                 context.view_layer.objects.active = obj
-                bpy.ops.object.mode_set(mode='EDIT')
-                bpy.ops.mesh.reveal()
-                bpy.ops.mesh.select_all(action='DESELECT')
-                if param == '0':
-                    # Neighbor Consistency Check: Flip only faces whose normal is opposite to the majority of their neighbors
-                    import bmesh
-                    bm = bmesh.from_edit_mesh(obj.data)
-                    bm.faces.ensure_lookup_table()
-                    faces_to_flip = []
-                    for f in bm.faces:
-                        neighbor_normals = []
-                        for loop in f.loops:
-                            edge = loop.edge
-                            for linked_face in edge.link_faces:
-                                if linked_face != f:
-                                    neighbor_normals.append(linked_face.normal.normalized())
-                        if not neighbor_normals:
-                            continue
-                        dot_products = [f.normal.normalized().dot(n) for n in neighbor_normals]
-                        num_opposite = sum(1 for d in dot_products if d < 0)
-                        if num_opposite > len(neighbor_normals) / 2:
-                            faces_to_flip.append(f)
-                    bpy.ops.mesh.select_all(action='DESELECT')
-                    for f in bm.faces:
-                        f.select = False
-                    for f in faces_to_flip:
-                        f.select = True
-                    bmesh.update_edit_mesh(obj.data, loop_triangles=False, destructive=False)
-                    bpy.ops.mesh.flip_normals()
-                elif param == '1':
-                    bpy.ops.mesh.select_all(action='SELECT')
-                    bpy.ops.mesh.normals_make_consistent(inside=False)
-                elif param == '2':
-                    bpy.ops.mesh.select_all(action='SELECT')
+                mode_set('EDIT')
+                with stats.phase('recalc_outside'):
+                    if region_rings(context) is None:
+                        bpy.ops.mesh.reveal()
+                        bpy.ops.mesh.select_all(action='SELECT')
                     bpy.ops.mesh.normals_make_consistent(inside=False)
-                    bpy.ops.mesh.flip_normals()
-                bpy.ops.object.mode_set(mode='OBJECT')
+                    if param == '2':
+                        bpy.ops.mesh.flip_normals()
+                mode_set('OBJECT')
                 log(obj.name + ' - operation complete!')
-            progress += 1
-            wm.progress_update(progress)
+                progress += 1
+                wm.progress_update(progress)
         wm.progress_end()
         return {'FINISHED'}
 
@@ -420,7 +3017,11 @@ def menu_func(self, context):
     self.layout.operator(flippen.bl_idname, icon='MESH_CUBE')
 
 def register():
+    global console_log
     bpy.utils.register_class(flippen_preferences)
+    addon = bpy.context.preferences.addons.get(__name__)
+    console_log = getattr(addon and addon.preferences, 'pref_log', False)
+    analysis_cache.budget_mb = getattr(addon and addon.preferences, 'pref_cache_mb', 512)
     bpy.utils.register_class(flippen)
     bpy.utils.register_class(FLIPPEN_OT_persistent)
     bpy.utils.register_class(FLIPPEN_OT_manual_align_run)
@@ -428,8 +3029,15 @@ def register():
     bpy.utils.register_class(FLIPPEN_OT_flood_flip)
     bpy.utils.register_class(FLIPPEN_OT_hybrid_flip)
     bpy.utils.register_class(FLIPPEN_OT_ao_flip)
+    bpy.utils.register_class(FLIPPEN_OT_winding_flip)
+    bpy.utils.register_class(FLIPPEN_OT_patch_flip)
+    bpy.utils.register_class(FLIPPEN_OT_stats_save)
+    bpy.utils.register_class(FLIPPEN_OT_result_cache_clear)
     bpy.utils.register_class(FLIPPEN_PT_panel)
+    bpy.utils.register_class(FLIPPEN_PT_stats)
     bpy.types.VIEW3D_MT_object.append(menu_func)
+    bpy.app.handlers.depsgraph_update_post.append(analysis_cache_update)
+    bpy.app.handlers.load_post.append(analysis_cache_clear)
     bpy.types.WindowManager.flippen_param = bpy.props.EnumProperty(
         items=[('0', 'Flip Normals', 'Flip Normals'),
                ('1', 'Make Normals Consistent', 'Make Normals Consistent'),
@@ -442,9 +3050,65 @@ def register():
         description='Maximum number of passes for Persistent Flip',
         default=5, min=1, max=20
     )
+    bpy.types.WindowManager.flippen_incremental = bpy.props.BoolProperty(
+        name='Run Until Stable',
+        description='Persistent Flip re-checks only faces next to the last flips and runs until nothing changes, ignoring Max Passes',
+        default=True
+    )
+    bpy.types.WindowManager.flippen_stats = bpy.props.BoolProperty(
+        name='Profile Runs',
+        description='Time every phase of the next runs and count faces, rays, passes and flips',
+        default=False
+    )
+    bpy.types.WindowManager.flippen_modal = bpy.props.BoolProperty(
+        name='Non-Blocking',
+        description='Run the flip tools in short time slices with progress in the status bar, so Blender stays responsive and Esc cancels without changing the mesh',
+        default=False
+    )
+    bpy.types.WindowManager.flippen_budget_ms = bpy.props.IntProperty(
+        name='Time Slice (ms)',
+        description='Work done per timer tick in non-blocking runs',
+        default=10, min=1, max=1000
+    )
+    bpy.types.WindowManager.flippen_thread = bpy.props.BoolProperty(
+        name='Worker Thread',
+        description='Do the NumPy and ray casting work of non-blocking runs on a background thread; only reading and writing the mesh stays on the main thread',
+        default=False
+    )
+    bpy.types.WindowManager.flippen_ray_others = bpy.props.BoolProperty(
+        name='Include Other Objects',
+        description='AO, Patch and Exterior Heuristic rays also hit other visible mesh objects; off tests each mesh only against itself',
+        default=False
+    )
+    bpy.types.WindowManager.flippen_low_memory = bpy.props.BoolProperty(
+        name='Low Memory',
+        description='Flip, Persistent, Hybrid, Manual Align and Flood Flip without the voxel grid work through the mesh in chunks that fit the memory budget, without keeping its analysis cached',
+        default=False
+    )
+    bpy.types.WindowManager.flippen_memory_mb = bpy.props.IntProperty(
+        name='Memory Budget (MB)',
+        description='Largest amount of extra memory a Low Memory run should take; the peak is reported afterwards',
+        default=1024, min=64, soft_max=16384
+    )
+    bpy.types.WindowManager.flippen_scope = bpy.props.EnumProperty(
+        items=[('WHOLE', 'Whole Mesh', 'Work on every face of the mesh'),
+               ('SELECTED', 'Selected Faces', 'Only work on the faces selected in Edit Mode, as if they were the whole mesh'),
+               ('CONTEXT', 'Selected Faces + Context', 'Only flip the faces selected in Edit Mode, judging them together with rings of faces around them that are kept as they are')],
+        name='Scope',
+        description='Which faces the flip tools work on; a smaller scope takes time by the size of the selection rather than of the mesh',
+        default='WHOLE'
+    )
+    bpy.types.WindowManager.flippen_scope_rings = bpy.props.IntProperty(
+        name='Context Rings',
+        description='Rings of neighbouring faces around the selection held as context (Manual Align aligns them to the selection)',
+        default=2, min=1, soft_max=16
+    )
 
 def unregister():
     bpy.types.VIEW3D_MT_object.remove(menu_func)
+    bpy.app.handlers.depsgraph_update_post.remove(analysis_cache_update)
+    bpy.app.handlers.load_post.remove(analysis_cache_clear)
+    analysis_cache.clear()
     bpy.utils.unregister_class(flippen)
     bpy.utils.unregister_class(flippen_preferences)
     bpy.utils.unregister_class(FLIPPEN_OT_persistent)
@@ -453,6 +3117,239 @@ def unregister():
     bpy.utils.unregister_class(FLIPPEN_OT_flood_flip)
     bpy.utils.unregister_class(FLIPPEN_OT_hybrid_flip)
     bpy.utils.unregister_class(FLIPPEN_OT_ao_flip)
+    bpy.utils.unregister_class(FLIPPEN_OT_patch_flip)
+    bpy.utils.unregister_class(FLIPPEN_OT_winding_flip)
+    bpy.utils.unregister_class(FLIPPEN_PT_stats)
     bpy.utils.unregister_class(FLIPPEN_PT_panel)
+    bpy.utils.unregister_class(FLIPPEN_OT_stats_save)
+    bpy.utils.unregister_class(FLIPPEN_OT_result_cache_clear)
     del bpy.types.WindowManager.flippen_param
-    del bpy.types.WindowManager.flippen_max_passes 
\ No newline at end of file
+    del bpy.types.WindowManager.flippen_max_passes
+    del bpy.types.WindowManager.flippen_incremental
+    del bpy.types.WindowManager.flippen_ray_others
+    del bpy.types.WindowManager.flippen_stats
+    del bpy.types.WindowManager.flippen_modal
+    del bpy.types.WindowManager.flippen_budget_ms
+    del bpy.types.WindowManager.flippen_thread
+    del bpy.types.WindowManager.flippen_low_memory
+    del bpy.types.WindowManager.flippen_memory_mb
+    del bpy.types.WindowManager.flippen_scope
+    del bpy.types.WindowManager.flippen_scope_rings
+
+# Command line batch processing:
+#   blender --background --python flippen_02.py -- models/*.glb -m persistent -o fixed/ --summary runs.jsonl
+# The driver spreads the files over a pool of background Blender processes, each running this
+# script again with --worker on a single file.
+
+IMPORTERS = {
+    '.obj': lambda path: bpy.ops.wm.obj_import(filepath=path),
+    '.glb': lambda path: bpy.ops.import_scene.gltf(filepath=path),
+    '.gltf': lambda path: bpy.ops.import_scene.gltf(filepath=path),
+}
+EXPORTERS = {
+    '.blend': lambda path: bpy.ops.wm.save_as_mainfile(filepath=path, copy=True),
+    '.obj': lambda path: bpy.ops.wm.obj_export(filepath=path, export_selected_objects=False),
+    '.glb': lambda path: bpy.ops.export_scene.gltf(filepath=path, export_format='GLB'),
+    '.gltf': lambda path: bpy.ops.export_scene.gltf(filepath=path, export_format='GLTF_SEPARATE'),
+}
+RESULT_PREFIX = 'flippen-result '
+LOW_MEMORY_METHODS = ('neighbor', 'persistent', 'hybrid', 'flood')
+
+def method_options(args):
+    options = {}
+    if args.method in ('persistent', 'hybrid'):
+        options.update(max_passes=args.max_passes, incremental=not args.fixed_passes)
+    if args.method in ('exhe', 'ao', 'patch'):
+        options['include_others'] = args.include_others
+    if args.method == 'ao':
+        options.update(distance=args.distance, margin=args.margin)
+    if args.method == 'patch':
+        options.update(distance=args.distance, sharp_angle=np.radians(args.sharp_angle), smoothness=args.smoothness)
+    # Without --samples each method keeps its own default, as its operator does
+    if args.method in ('ao', 'patch') and args.samples is not None:
+        options['samples'] = args.samples
+    if args.method == 'winding':
+        options.update(accuracy=args.accuracy, margin=args.margin)
+    if args.method in ('flood', 'exhe'):
+        options.update(resolution=args.voxel_resolution, memory_mb=args.voxel_memory)
+        if args.voxels is not None:
+            options['voxels'] = args.voxels
+    if args.low_memory and args.method in LOW_MEMORY_METHODS:
+        options['low_memory_mb'] = args.low_memory
+    if args.region_rings is not None:
+        options['region_rings'] = args.region_rings
+    return options
+
+def low_memory_note(args):
+    # Why --low-memory cannot be honoured for this run, or None when it can (or is not given)
+    if not args.low_memory:
+        return None
+    if args.region_rings is not None:
+        return '--region-rings analyses the selection in one go'
+    if args.method not in LOW_MEMORY_METHODS:
+        return f'{args.method} has no Low Memory mode'
+    if args.method == 'flood' and args.voxels is not False:
+        return 'flood only works in chunks with --no-voxels'
+    return None
+
+def process_file(path, output, method, options, profile=False):
+    start = time.perf_counter()
+    if path.lower().endswith('.blend'):
+        bpy.ops.wm.open_mainfile(filepath=path)
+    else:
+        bpy.ops.wm.read_factory_settings(use_empty=True)
+        IMPORTERS[os.path.splitext(path)[1].lower()](path)
+    context = bpy.context
+    if context.mode != 'OBJECT':
+        mode_set('OBJECT')
+    summary = {'file': path, 'output': output, 'method': method, 'objects': 0, 'faces': 0, 'flipped': 0}
+    meshes = set()
+    with stats.run(method, profile, file=path):
+        for obj in context.scene.objects:
+            if obj.type != 'MESH' or obj.data.as_pointer() in meshes:
+                continue
+            meshes.add(obj.data.as_pointer())
+            result = METHODS[method](context, obj, **options)
+            summary['objects'] += 1
+            for key, value in result.items():
+                summary[key] = max(summary.get(key, 0), value) if key == 'peak_mb' else summary.get(key, 0) + value
+    summary['process_seconds'] = round(time.perf_counter() - start, 4)
+    if profile:
+        summary['stats'] = stats.last
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    EXPORTERS[os.path.splitext(output)[1].lower()](output)
+    summary['seconds'] = round(time.perf_counter() - start, 4)
+    return summary
+
+def output_path(path, output, single):
+    if single and os.path.splitext(output)[1].lower() in EXPORTERS:
+        return output
+    return os.path.join(output, os.path.basename(path))
+
+def run_worker(args):
+    import json
+    if args.result_cache:
+        result_cache.directory = os.path.abspath(args.result_cache)
+        result_cache.limit_mb = args.result_cache_mb
+    summary = process_file(args.inputs[0], args.output, args.method, method_options(args), args.stats)
+    print(RESULT_PREFIX + json.dumps(summary), flush=True)
+    return 0
+
+def run_driver(args):
+    import glob
+    import json
+    import subprocess
+    from concurrent.futures import ThreadPoolExecutor
+    paths = []
+    for pattern in args.inputs:
+        matches = sorted(glob.glob(pattern, recursive=True)) or [pattern]
+        paths.extend(p for p in matches if os.path.splitext(p)[1].lower() in EXPORTERS)
+    if not paths:
+        print('flippen: no .blend, .obj, .glb or .gltf inputs found', file=sys.stderr)
+        return 2
+    note = low_memory_note(args)
+    if note:
+        print(f'flippen: warning: --low-memory ignored, {note}', file=sys.stderr)
+    if args.blender:
+        command = [args.blender, '--background', '--factory-startup', '--python-exit-code', '1',
+                   '--python', os.path.abspath(__file__), '--']
+    else:
+        command = [sys.executable, os.path.abspath(__file__)]
+    options = ['--method', args.method, '--max-passes', str(args.max_passes),
+               '--distance', repr(args.distance), '--margin', repr(args.margin), '--accuracy', repr(args.accuracy),
+               '--voxel-resolution', str(args.voxel_resolution), '--voxel-memory', str(args.voxel_memory),
+               '--sharp-angle', repr(args.sharp_angle), '--smoothness', repr(args.smoothness)]
+    if args.samples is not None:
+        options += ['--samples', str(args.samples)]
+    if args.voxels is not None:
+        options.append('--voxels' if args.voxels else '--no-voxels')
+    if args.low_memory:
+        options += ['--low-memory', str(args.low_memory)]
+    if args.region_rings is not None:
+        options += ['--region-rings', str(args.region_rings)]
+    if args.result_cache:
+        options += ['--result-cache', os.path.abspath(args.result_cache), '--result-cache-mb', str(args.result_cache_mb)]
+    for flag in ('fixed_passes', 'include_others', 'verbose', 'stats'):
+        if getattr(args, flag):
+            options.append('--' + flag.replace('_', '-'))
+
+    def work(path):
+        output = output_path(path, args.output, len(paths) == 1)
+        start = time.perf_counter()
+        proc = subprocess.run(command + ['--worker', path, '--output', output] + options,
+                              capture_output=True, text=True)
+        for line in proc.stdout.splitlines():
+            if line.startswith(RESULT_PREFIX):
+                summary = json.loads(line[len(RESULT_PREFIX):])
+                break
+        else:
+            tail = (proc.stderr or proc.stdout).strip().splitlines()[-5:]
+            summary = {'file': path, 'output': output, 'method': args.method, 'error': '\n'.join(tail),
+                       'returncode': proc.returncode}
+        summary['wall_seconds'] = round(time.perf_counter() - start, 4)
+        return summary
+
+    failed = 0
+    out = open(args.summary, 'a') if args.summary else sys.stdout
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+            for summary in pool.map(work, paths):
+                failed += 'error' in summary
+                out.write(json.dumps(summary) + '\n')
+                out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 1 if failed else 0
+
+def main(argv):
+    import argparse
+    global console_log
+    parser = argparse.ArgumentParser(
+        prog='flippen',
+        description='Fix face orientation of .blend, .obj, .glb and .gltf files in background Blender')
+    parser.add_argument('inputs', nargs='+', help='Input files or glob patterns')
+    parser.add_argument('-o', '--output', required=True,
+                        help='Output directory, or output file when there is a single input')
+    parser.add_argument('-m', '--method', choices=sorted(METHODS), default='neighbor', help='Flip method')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='Number of Blender worker processes')
+    parser.add_argument('--summary', help='Append per-file JSON lines here instead of printing them')
+    parser.add_argument('--blender', default=bpy.app.binary_path or None,
+                        help='Blender executable for the workers (default: the running one)')
+    parser.add_argument('--max-passes', type=int, default=5, help='Persistent/Hybrid: passes with --fixed-passes')
+    parser.add_argument('--fixed-passes', action='store_true',
+                        help='Persistent/Hybrid: full re-scans up to --max-passes instead of running until stable')
+    parser.add_argument('--include-others', action='store_true', help='Exterior/AO/Patch: rays also hit other objects')
+    parser.add_argument('--samples', type=int, help='AO/Patch: rays per hemisphere (default: 16 for ao, 8 for patch)')
+    parser.add_argument('--distance', type=float, default=0.5, help='AO/Patch: ray distance')
+    parser.add_argument('--margin', type=float, default=0.2, help='AO/Winding: decision margin')
+    parser.add_argument('--accuracy', type=float, default=2.0, help='Winding: far field distance in node radii')
+    parser.add_argument('--voxels', action=argparse.BooleanOptionalAction, default=None,
+                        help='Flood/Exterior: use the voxel grid (default: on for flood, off for exhe)')
+    parser.add_argument('--voxel-resolution', type=int, default=128,
+                        help='Flood/Exterior: voxels along the longest side of the bounding box')
+    parser.add_argument('--voxel-memory', type=int, default=256, help='Flood/Exterior: voxel grid memory cap in MB')
+    parser.add_argument('--sharp-angle', type=float, default=60.0, help='Patch: degrees of turn that end a patch')
+    parser.add_argument('--smoothness', type=float, default=1.0, help='Patch: weight of winding agreement against rays')
+    parser.add_argument('--low-memory', type=int, metavar='MB',
+                        help='Neighbor/Persistent/Hybrid/Flood without voxels: work in chunks within this memory budget')
+    parser.add_argument('--region-rings', type=int, metavar='N',
+                        help='Only flip the faces selected in the file, with N rings of faces around them as context')
+    parser.add_argument('--result-cache', metavar='DIR',
+                        help='Reuse the flips stored here for meshes seen before, and store the new ones')
+    parser.add_argument('--result-cache-mb', type=int, default=ResultCache.LIMIT_MB, metavar='MB',
+                        help='Result cache size limit; the least recently used results are removed beyond it')
+    parser.add_argument('--verbose', action='store_true', help='Log to the console')
+    parser.add_argument('--stats', action='store_true', help='Add per-phase timings and counters to each summary')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    console_log = args.verbose
+    if args.worker:
+        return run_worker(args)
+    return run_driver(args)
+
+if __name__ == '__main__':
+    if bpy.app.background:
+        sys.exit(main(sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else sys.argv[1:]))
+    register()
@@ -0,0 +1,284 @@
+# flippen benchmark harness, run in background Blender:
+#   blender --background --factory-startup --python flippen_bench.py -- --sizes 1000 100000 1000000 --output bench.jsonl
+# Every shape is generated with correct normals, a known fraction of its faces is flipped, and each
+# method is run on a fresh copy. One JSON line per (shape, size, method) reports wall time, faces/sec,
+# peak memory and orientation accuracy against the generated ground truth.
+# Compare two runs with --baseline old.jsonl.
+
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import bpy
+import numpy as np
+
+def load_flippen():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'flippen_02.py')
+    spec = importlib.util.spec_from_file_location('flippen_02', path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['flippen_02'] = module
+    spec.loader.exec_module(module)
+    return module
+
+flippen = load_flippen()
+
+# Shape generators return (vertex coordinates, quads as an (n, 4) vertex index array)
+
+def merge_vertices(co, quads):
+    keys = np.round(co * 1e6).astype(np.int64)
+    _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    return co[first], inverse.reshape(-1)[quads]
+
+def subdivided_box(n):
+    # Closed box from -1 to 1 with n x n quads per side, wound outward
+    t = np.linspace(-1.0, 1.0, n + 1)
+    u, v = np.meshgrid(t, t, indexing='ij')
+    co, quads = [], []
+    offset = 0
+    for axis in range(3):
+        a, b = [i for i in range(3) if i != axis]
+        for sign in (-1.0, 1.0):
+            p = np.empty((n + 1, n + 1, 3))
+            p[..., axis] = sign
+            p[..., a] = u
+            p[..., b] = v
+            idx = np.arange((n + 1) ** 2).reshape(n + 1, n + 1) + offset
+            q = np.stack([idx[:-1, :-1], idx[1:, :-1], idx[1:, 1:], idx[:-1, 1:]], axis=-1).reshape(-1, 4)
+            # (a, b) runs along the grid, so the quads face +axis when a, b, axis is a cyclic order
+            if np.cross(np.eye(3)[a], np.eye(3)[b])[axis] * sign < 0:
+                q = q[:, ::-1]
+            co.append(p.reshape(-1, 3))
+            quads.append(q)
+            offset += (n + 1) ** 2
+    return merge_vertices(np.concatenate(co), np.concatenate(quads))
+
+def combine(parts):
+    co, quads, offset = [], [], 0
+    for part_co, part_quads in parts:
+        co.append(part_co)
+        quads.append(part_quads + offset)
+        offset += len(part_co)
+    return np.concatenate(co), np.concatenate(quads)
+
+def shape_sphere(faces, rng):
+    n = max(1, int(round(np.sqrt(faces / 6))))
+    co, quads = subdivided_box(n)
+    return co / np.linalg.norm(co, axis=1)[:, None], quads
+
+def shape_building(faces, rng):
+    # Grid of rooms inside an outer shell: room surfaces face into the rooms, the shell faces out
+    n = 8
+    rooms = max(1, int(round(np.sqrt(faces / (6 * n * n)))))
+    box_co, box_quads = subdivided_box(n)
+    parts = []
+    for i in range(rooms):
+        for j in range(rooms):
+            center = np.array([2.2 * i, 2.2 * j, 0.0])
+            parts.append((box_co * [1.0, 1.0, 1.2] + center, box_quads[:, ::-1]))
+    extent = 2.2 * (rooms - 1) / 2
+    parts.append((box_co * [extent + 1.1, extent + 1.1, 1.3] + [extent, extent, 0.0], box_quads))
+    return combine(parts)
+
+def shape_open(faces, rng):
+    # Rolling open terrain, facing up
+    n = max(1, int(round(np.sqrt(faces))))
+    t = np.linspace(0.0, 10.0, n + 1)
+    x, y = np.meshgrid(t, t, indexing='ij')
+    co = np.stack([x, y, 0.5 * np.sin(x) * np.cos(0.7 * y)], axis=-1).reshape(-1, 3)
+    idx = np.arange((n + 1) ** 2).reshape(n + 1, n + 1)
+    quads = np.stack([idx[:-1, :-1], idx[1:, :-1], idx[1:, 1:], idx[:-1, 1:]], axis=-1).reshape(-1, 4)
+    return co, quads
+
+def shape_kit(faces, rng):
+    # Scattered small closed parts, one island each
+    n = 4
+    count = max(1, int(round(faces / (6 * n * n))))
+    box_co, box_quads = subdivided_box(n)
+    side = int(np.ceil(np.cbrt(count)))
+    parts = []
+    for k in range(count):
+        center = 3.0 * np.array([k % side, (k // side) % side, k // (side * side)], dtype=float)
+        parts.append((box_co * rng.uniform(0.3, 1.0, 3) + center, box_quads))
+    return combine(parts)
+
+SHAPES = {
+    'sphere': shape_sphere,
+    'building': shape_building,
+    'open': shape_open,
+    'kit': shape_kit,
+}
+
+def build_mesh(name, co, quads):
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(len(co))
+    mesh.vertices.foreach_set('co', co.astype(np.float32).ravel())
+    mesh.loops.add(quads.size)
+    mesh.loops.foreach_set('vertex_index', quads.astype(np.int32).ravel())
+    mesh.polygons.add(len(quads))
+    mesh.polygons.foreach_set('loop_start', np.arange(0, quads.size, 4, dtype=np.int32))
+    mesh.update(calc_edges=True)
+    return mesh
+
+def add_backdrop(mesh):
+    # A ground plane under the mesh as a second object, for the ray methods' Include Other Objects
+    co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get('co', co)
+    co = co.reshape(-1, 3)
+    low, high = co.min(axis=0), co.max(axis=0)
+    pad = 0.1 * (high - low).max()
+    x0, y0, x1, y1 = low[0] - pad, low[1] - pad, high[0] + pad, high[1] + pad
+    z = low[2] - pad
+    plane = build_mesh('backdrop', np.array([[x0, y0, z], [x1, y0, z], [x1, y1, z], [x0, y1, z]]), np.array([[0, 1, 2, 3]]))
+    obj = bpy.data.objects.new(plane.name, plane)
+    bpy.context.scene.collection.objects.link(obj)
+    return obj
+
+def face_normals(mesh):
+    normals = np.empty(len(mesh.polygons) * 3, dtype=np.float32)
+    mesh.polygons.foreach_get('normal', normals)
+    return normals.reshape(-1, 3)
+
+def make_case(shape, faces, flip_fraction, seed):
+    # The broken mesh plus its ground truth normals and face islands
+    rng = np.random.default_rng(seed)
+    co, quads = SHAPES[shape](faces, rng)
+    mesh = build_mesh(f'{shape}_{faces}', co, quads)
+    truth = face_normals(mesh).copy()
+    graph = flippen.FaceGraph.from_mesh(mesh)
+    islands = flippen.face_islands(graph)
+    flippen.flip_mesh_faces(mesh, graph, rng.random(graph.n_faces) < flip_fraction)
+    return mesh, truth, islands
+
+def accuracy(mesh, truth, islands):
+    # Share of faces matching the ground truth, and the same allowing each island one global flip
+    # (all that the consistency-only methods can promise)
+    correct = np.einsum('ij,ij->i', face_normals(mesh), truth) > 0
+    per_island = np.bincount(islands, weights=correct, minlength=len(islands))
+    size = np.bincount(islands, minlength=len(islands))
+    best = np.maximum(per_island, size - per_island).sum()
+    return float(correct.mean()), float(best / len(correct))
+
+def select_seeds(mesh, truth, islands):
+    # Manual Align stand-in for the user: one correctly oriented face selected per island
+    correct = np.einsum('ij,ij->i', face_normals(mesh), truth) > 0
+    candidates = np.flatnonzero(correct)
+    _, first = np.unique(islands[candidates], return_index=True)
+    select = np.zeros(len(mesh.polygons), dtype=bool)
+    select[candidates[first]] = True
+    mesh.polygons.foreach_set('select', select)
+
+def run_method(method, broken, truth, islands, options, measure_memory):
+    mesh = broken.copy()
+    obj = bpy.data.objects.new(mesh.name, mesh)
+    bpy.context.scene.collection.objects.link(obj)
+    bpy.context.view_layer.objects.active = obj
+    obj.select_set(True)
+    flippen.analysis_cache.clear()
+    if method == 'manual_align':
+        select_seeds(mesh, truth, islands)
+        run = flippen.run_manual_align
+    else:
+        run = flippen.METHODS[method]
+    if measure_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = run(bpy.context, obj, **options.get(method, {}))
+    seconds = time.perf_counter() - start
+    record = {'seconds': round(seconds, 5), 'flipped': int(result['flipped'])}
+    if 'peak_mb' in result:
+        record.update(chunks=result['chunks'], chunked_peak_mb=result['peak_mb'])
+    if measure_memory:
+        record['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 3)
+        tracemalloc.stop()
+    record['accuracy'], record['consistency'] = accuracy(mesh, truth, islands)
+    bpy.data.objects.remove(obj)
+    bpy.data.meshes.remove(mesh)
+    flippen.analysis_cache.clear()
+    return record
+
+def compare(baseline_path, records):
+    # Speed ratio and accuracy change against an earlier run, per shape, size and method
+    baseline = {}
+    with open(baseline_path) as f:
+        for line in f:
+            r = json.loads(line)
+            baseline[(r['shape'], r['faces'], r['method'])] = r
+    for r in records:
+        old = baseline.get((r['shape'], r['faces'], r['method']))
+        if old is None:
+            continue
+        speedup = old['seconds'] / r['seconds'] if r['seconds'] else float('inf')
+        print(f"{r['shape']:>9} {r['faces']:>9} {r['method']:>13}  {speedup:7.2f}x speed  "
+              f"{r['accuracy'] - old['accuracy']:+.4f} accuracy", file=sys.stderr)
+
+def main(argv):
+    methods = sorted(flippen.METHODS) + ['manual_align']
+    parser = argparse.ArgumentParser(prog='flippen_bench', description='Benchmark flippen methods on synthetic broken meshes')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='Target face counts')
+    parser.add_argument('--shapes', nargs='+', choices=sorted(SHAPES), default=sorted(SHAPES))
+    parser.add_argument('--methods', nargs='+', choices=methods, default=methods)
+    parser.add_argument('--flip-fraction', type=float, default=0.1, help='Share of faces flipped at random')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per case; the fastest is reported')
+    parser.add_argument('--ao-samples', type=int, default=16)
+    parser.add_argument('--low-memory', type=int, metavar='MB',
+                        help='Run neighbor, persistent, hybrid and manual_align in Low Memory mode with this budget')
+    parser.add_argument('--include-others', action='store_true',
+                        help='Put a ground plane under each shape and run ao, exhe and patch with Include Other Objects')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the separate traced run that measures peak memory')
+    parser.add_argument('--output', help='Append JSON lines here instead of printing them')
+    parser.add_argument('--baseline', help='JSON lines from an earlier run to compare against')
+    args = parser.parse_args(argv)
+    options = {'ao': {'samples': args.ao_samples}}
+    if args.low_memory:
+        for method in ('neighbor', 'persistent', 'hybrid', 'manual_align'):
+            options.setdefault(method, {})['low_memory_mb'] = args.low_memory
+    if args.include_others:
+        for method in ('ao', 'exhe', 'patch'):
+            options.setdefault(method, {})['include_others'] = True
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    out = open(args.output, 'a') if args.output else sys.stdout
+    records = []
+    try:
+        for shape in args.shapes:
+            for size in args.sizes:
+                broken, truth, islands = make_case(shape, size, args.flip_fraction, args.seed)
+                backdrop = add_backdrop(broken) if args.include_others else None
+                for method in args.methods:
+                    runs = [run_method(method, broken, truth, islands, options, False) for _ in range(args.repeat)]
+                    record = min(runs, key=lambda r: r['seconds'])
+                    if not args.no_memory:
+                        record['peak_mb'] = run_method(method, broken, truth, islands, options, True)['peak_mb']
+                    record = {
+                        'version': '.'.join(map(str, flippen.bl_info['version'])),
+                        'blender': bpy.app.version_string,
+                        'shape': shape,
+                        'faces': len(broken.polygons),
+                        'method': method,
+                        'flip_fraction': args.flip_fraction,
+                        'seed': args.seed,
+                        'include_others': args.include_others,
+                        **record,
+                        'faces_per_sec': round(len(broken.polygons) / record['seconds']) if record['seconds'] else None,
+                    }
+                    records.append(record)
+                    out.write(json.dumps(record) + '\n')
+                    out.flush()
+                bpy.data.meshes.remove(broken)
+                if backdrop is not None:
+                    plane = backdrop.data
+                    bpy.data.objects.remove(backdrop)
+                    bpy.data.meshes.remove(plane)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if args.baseline:
+        compare(args.baseline, records)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []))